@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+
+# Add parent directory to path to import config
+sys.path.append(str(Path(__file__).parent.parent))
+
+import tensorflow as tf
+import tf2onnx  # pip install tf2onnx (chỉ cần khi export)
+from deepface import DeepFace
+
+from src.config.deepface_config import ONNX_CONFIG
+
+# Output path (relative to backend directory, same as the service)
+OUTPUT_PATH = Path(__file__).parent.parent / ONNX_CONFIG['model_path']
+
+def export_onnx_model():
+    """Export DeepFace embedding model (Keras) to ONNX"""
+    model_name = ONNX_CONFIG['model_name']
+    input_height, input_width = ONNX_CONFIG['input_size']
+
+    print(f"🚀 Exporting {model_name} to ONNX...")
+
+    # Build Keras model through DeepFace (downloads weights if needed)
+    keras_model = DeepFace.build_model(model_name).model
+
+    input_signature = [tf.TensorSpec((None, input_height, input_width, 3), tf.float32, name="input")]
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tf2onnx.convert.from_keras(
+        keras_model,
+        input_signature=input_signature,
+        opset=17,
+        output_path=str(OUTPUT_PATH)
+    )
+
+    print(f"✅ Saved: {OUTPUT_PATH}")
+
+if __name__ == "__main__":
+    export_onnx_model()
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from src.services.facial_recognition import add_face, recognize_face, get_faces_info, delete_face
-from src.services.camera_service import capture_frame, get_latest_frame, initialize_camera, start_capture, stop_capture, get_available_cameras, get_camera_info
+from typing import List
+from src.services.facial_recognition import add_face, add_faces, recognize_face, recognize_face_bytes, get_faces_info, delete_face
+from src.services.camera_service import capture_frame_bytes, get_latest_frame, initialize_camera, start_capture, stop_capture, get_available_cameras, get_camera_info
 from src.services.door_service import door_service
 import logging
 import os
@@ -16,6 +17,14 @@ class FaceAddRequest(BaseModel):
     image: str = None
     variation_type: str = "default"  # Thêm field này
 
+class FaceVariationImage(BaseModel):
+    variation_type: str = "default"
+    image: str
+
+class FaceAddBatchRequest(BaseModel):
+    name: str
+    images: List[FaceVariationImage]
+
 class FaceRecognizeRequest(BaseModel):
     image: str = None  # Optional, if not provided will capture from camera
 
@@ -56,6 +65,39 @@ async def add_face_route(request: FaceAddRequest):
         logger.error(f"Unexpected error adding face: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/faces/add-batch")
+async def add_faces_batch_route(request: FaceAddBatchRequest):
+    """Add multiple variations for one person, uploading all images in one batch"""
+    try:
+        if not request.images:
+            raise HTTPException(status_code=400, detail="At least one image is required")
+        
+        name = request.name.strip()
+        if not name or len(name) < 2:
+            raise HTTPException(status_code=400, detail="Name must be at least 2 characters")
+        
+        if not re.match(r"^[\w\s\u00C0-\u024F\u1E00-\u1EFF]+$", name, re.UNICODE):
+            raise HTTPException(status_code=400, detail="Name contains invalid characters")
+        
+        images = []
+        for item in request.images:
+            variation_type = item.variation_type.strip() if item.variation_type else "default"
+            if not re.match("^[a-zA-Z0-9_]+$", variation_type):
+                raise HTTPException(status_code=400, detail="Variation type can only contain letters, numbers and underscore")
+            images.append((variation_type, item.image))
+        
+        result = await add_faces(name, images)
+        return {"success": True, "message": "Face variations added successfully", "result": result}
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.error(f"Validation error adding faces batch: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Unexpected error adding faces batch: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.post("/faces/recognize")
 async def recognize_face_route(request: FaceRecognizeRequest):
     """Recognize face and trigger door opening if successful"""
@@ -109,7 +151,7 @@ async def add_face_realtime(request: FaceAddRequest):
     try:
         logger.info(f"Adding face realtime for: {request.name}")
         
-        image_data = capture_frame()
+        image_data = capture_frame_bytes()
         if not image_data:
             raise HTTPException(status_code=500, detail="Cannot capture image from camera")
         
@@ -129,11 +171,11 @@ async def recognize_face_realtime():
     try:
         logger.info("Recognizing face realtime")
         
-        image_data = capture_frame()
+        image_data = capture_frame_bytes()
         if not image_data:
             raise HTTPException(status_code=500, detail="Cannot capture image from camera")
         
-        result = recognize_face(image_data)
+        result = recognize_face_bytes(image_data)
         return {"success": True, "message": "Face recognition completed from camera", "result": result}
         
     except ValueError as e:
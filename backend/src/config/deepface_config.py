@@ -66,4 +66,19 @@ ENROLLMENT_CONFIG = {
     'enforce_detection': True,  # Bắt buộc phải có face
     'align': True,
     'normalization': 'base'
-}
\ No newline at end of file
+}
+
+# ONNX Runtime configuration (embedding model chạy bằng ONNX Runtime thay vì TensorFlow)
+# Export model một lần bằng: python scripts/export_onnx_model.py
+ONNX_CONFIG = {
+    'model_name': 'Facenet512',  # Model được export sang ONNX
+    'model_path': 'data/models/facenet512.onnx',
+    'input_size': (160, 160),
+    # Thứ tự ưu tiên, provider không có sẵn sẽ bị bỏ qua
+    'providers': [
+        'CUDAExecutionProvider',
+        'CoreMLExecutionProvider',
+        'DmlExecutionProvider',  # DirectML (Windows)
+        'CPUExecutionProvider'
+    ]
+}
@@ -87,16 +87,22 @@ class CameraService:
                 
             time.sleep(0.033)  # ~30 FPS
     
+    def _read_frame(self) -> np.ndarray:
+        """Read a single BGR frame, initializing the camera if needed (raises ValueError on failure)"""
+        if self.camera is None or not self.camera.isOpened():
+            if not self.initialize_camera():
+                raise ValueError("Cannot initialize camera")
+        
+        ret, frame = self.camera.read()
+        if not ret or frame is None:
+            raise ValueError("Cannot capture frame from camera")
+        
+        return frame
+    
     def capture_frame(self) -> Optional[str]:
         """Capture a single frame and return as base64"""
         try:
-            if self.camera is None or not self.camera.isOpened():
-                if not self.initialize_camera():
-                    raise ValueError("Cannot initialize camera")
-            
-            ret, frame = self.camera.read()
-            if not ret or frame is None:
-                raise ValueError("Cannot capture frame from camera")
+            frame = self._read_frame()
             
             # Convert BGR to RGB
             frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -108,6 +114,23 @@ class CameraService:
             logger.error(f"Error capturing frame: {e}")
             return None
     
+    def capture_frame_bytes(self) -> Optional[bytes]:
+        """Capture a single frame and return as JPEG bytes (no base64 round-trip)"""
+        try:
+            frame = self._read_frame()
+            
+            # Frame is already BGR, encode directly
+            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
+            success, buffer = cv2.imencode('.jpg', frame, encode_param)
+            if not success:
+                raise ValueError("Failed to encode frame as JPEG")
+            
+            return buffer.tobytes()
+            
+        except Exception as e:
+            logger.error(f"Error capturing frame bytes: {e}")
+            return None
+    
     def get_latest_frame(self) -> Optional[str]:
         """Get the latest frame from continuous capture"""
         try:
@@ -196,6 +219,9 @@ camera_service = CameraService()
 def capture_frame():
     return camera_service.capture_frame()
 
+def capture_frame_bytes():
+    return camera_service.capture_frame_bytes()
+
 def get_latest_frame():
     return camera_service.get_latest_frame()
 
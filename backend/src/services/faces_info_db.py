@@ -0,0 +1,195 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class FacesInfoDatabase:
+    """
+    SQLite (WAL mode) storage for face information
+    Thay thế faces_info.json: mỗi thao tác là một câu lệnh SQL thay vì đọc/ghi lại toàn bộ file
+    """
+
+    def __init__(self, db_path: str, legacy_json_path: Optional[str] = None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        self._create_schema()
+
+        # Import existing faces_info.json on first run
+        if legacy_json_path and os.path.exists(legacy_json_path) and self._is_empty():
+            self.import_json(legacy_json_path)
+
+    def _create_schema(self):
+        """Create tables if they do not exist"""
+        with self._lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS people (
+                    name TEXT PRIMARY KEY,
+                    model_name TEXT,
+                    added_date TEXT,
+                    recognition_count INTEGER DEFAULT 0,
+                    last_recognized TEXT,
+                    last_updated TEXT
+                )
+            """)
+            # Surrogate id: một người có thể có nhiều variation cùng type (append-only như faces_info.json)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS variations (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT,
+                    type TEXT,
+                    image_path TEXT,
+                    image_url TEXT,
+                    added_date TEXT
+                )
+            """)
+
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_variations_name ON variations (name)")
+
+    def _is_empty(self) -> bool:
+        row = self.conn.execute("SELECT COUNT(*) FROM people").fetchone()
+        return row[0] == 0
+
+    def add_variation(self, name: str, model_name: str, variation_type: str, image_path: str, image_url: Optional[str]):
+        """Add a variation, creating the person if needed"""
+        now = datetime.now().isoformat()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO people (name, model_name, added_date, recognition_count, last_updated) "
+                "VALUES (?, ?, ?, 0, ?)",
+                (name, model_name, now, now)
+            )
+            self.conn.execute(
+                "INSERT INTO variations (name, type, image_path, image_url, added_date) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (name, variation_type, image_path, image_url, now)
+            )
+            self.conn.execute("UPDATE people SET last_updated=? WHERE name=?", (now, name))
+
+    def increment_recognition_count(self, name: str):
+        """Increase recognition count and update last recognized time"""
+        now = datetime.now().isoformat()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE people SET recognition_count=recognition_count+1, last_recognized=? WHERE name=?",
+                (now, name)
+            )
+
+    def delete_person(self, name: str):
+        """Delete a person and all of their variations"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM variations WHERE name=?", (name,))
+            self.conn.execute("DELETE FROM people WHERE name=?", (name,))
+
+    def delete_variation(self, name: str, variation_type: str):
+        """Delete a single variation of a person (the oldest one of that type, same as faces_db.pkl)"""
+        now = datetime.now().isoformat()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM variations WHERE id = "
+                "(SELECT id FROM variations WHERE name=? AND type=? ORDER BY id LIMIT 1)",
+                (name, variation_type)
+            )
+            self.conn.execute("UPDATE people SET last_updated=? WHERE name=?", (now, name))
+
+    def get_all(self) -> List[Dict]:
+        """Get all people with their variations (same structure as faces_info.json)"""
+        with self._lock:
+            rows = self.conn.execute("""
+                SELECT p.name, p.model_name, p.added_date, p.recognition_count,
+                       p.last_recognized, p.last_updated,
+                       v.type, v.image_path, v.image_url, v.added_date AS variation_added_date
+                FROM people p
+                LEFT JOIN variations v ON v.name = p.name
+                ORDER BY p.rowid, v.id
+            """).fetchall()
+
+        people = {}
+        for row in rows:
+            person = people.get(row['name'])
+            if person is None:
+                person = {
+                    'name': row['name'],
+                    'model_name': row['model_name'],
+                    'added_date': row['added_date'],
+                    'recognition_count': row['recognition_count'],
+                    'variations': [],
+                    'total_variations': 0,
+                    'last_updated': row['last_updated']
+                }
+                if row['last_recognized']:
+                    person['last_recognized'] = row['last_recognized']
+                people[row['name']] = person
+
+            if row['type'] is not None:
+                variation = {
+                    'type': row['type'],
+                    'image_path': row['image_path'],
+                    'added_date': row['variation_added_date']
+                }
+                # Local-only entries have no URL (as in faces_info.json): /faces/info falls back to /api/images/<file>
+                if row['image_url']:
+                    variation['image_url'] = row['image_url']
+                person['variations'].append(variation)
+                person['total_variations'] = len(person['variations'])
+
+        return list(people.values())
+
+    def import_json(self, json_path: str):
+        """Import people from a faces_info.json file"""
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                faces_info = json.load(f)
+
+            with self._lock, self.conn:
+                for person in faces_info:
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO people (name, model_name, added_date, recognition_count, last_recognized, last_updated) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            person['name'],
+                            person.get('model_name'),
+                            person.get('added_date'),
+                            person.get('recognition_count', 0),
+                            person.get('last_recognized'),
+                            person.get('last_updated', person.get('added_date'))
+                        )
+                    )
+
+                    variations = person.get('variations', [])
+                    # Legacy single-image entries
+                    if not variations and person.get('image_path'):
+                        variations = [{'type': 'default', 'image_path': person['image_path'], 'added_date': person.get('added_date')}]
+
+                    for variation in variations:
+                        self.conn.execute(
+                            "INSERT INTO variations (name, type, image_path, image_url, added_date) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (
+                                person['name'],
+                                variation.get('type', 'default'),
+                                variation.get('image_path'),
+                                variation.get('image_url'),
+                                variation.get('added_date')
+                            )
+                        )
+
+            logger.info(f"Imported {len(faces_info)} people from {json_path}")
+
+        except Exception as e:
+            logger.error(f"Error importing faces info from JSON: {e}")
+
+    def export_json(self, json_path: str):
+        """Export all face information to a JSON file"""
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.get_all(), f, ensure_ascii=False, indent=2)
@@ -1,21 +1,31 @@
 import os
-import json
 import pickle
+import asyncio
+import threading
 import logging
 import numpy as np
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 import tempfile
 import cv2
 
 # DeepFace imports
 from deepface import DeepFace
+from deepface.modules import preprocessing
 import tensorflow as tf
+import onnxruntime as ort
+
+# Numba is optional: JIT-compiled distance kernels, NumPy is used when unavailable
+try:
+    import numba
+except ImportError:
+    numba = None
 
 # Local imports
-from src.utils.image_utils import decode_base64_image, encode_image_to_base64
-from src.config.deepface_config import DEFAULT_CONFIG, REALTIME_CONFIG, ENROLLMENT_CONFIG
+from src.utils.image_utils import decode_base64_image, decode_base64_to_bytes, decode_image_bytes, encode_image_to_base64
+from src.config.deepface_config import DEFAULT_CONFIG, REALTIME_CONFIG, ENROLLMENT_CONFIG, ONNX_CONFIG
 from src.services.supabase_service import supabase_service
+from src.services.faces_info_db import FacesInfoDatabase
 
 logger = logging.getLogger(__name__)
 
@@ -23,10 +33,51 @@ logger = logging.getLogger(__name__)
 tf.get_logger().setLevel('ERROR')
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
+# Gallery size (embeddings x dimension) from which one batched matrix scan beats per-vector calls
+BATCH_SCAN_MIN_WORK = 128_000
+
+def _clip(x, lo, hi):
+    """Clamp a Python scalar (cheaper than np.clip, which allocates a 0-d array)"""
+    return lo if x < lo else (hi if x > hi else x)
+
+def _mean_brightness(image: np.ndarray) -> float:
+    """Mean luminance of an RGB image (cv2.mean reduces in place, no grayscale copy)"""
+    r, g, b, _ = cv2.mean(image)
+    return 0.299 * r + 0.587 * g + 0.114 * b
+
+if numba is not None:
+    @numba.njit(cache=True, fastmath=True)
+    def _cosine_nb(a, b):
+        """Cosine distance in one pass, returns -1.0 if either norm is zero"""
+        dot = 0.0
+        norm_a = 0.0
+        norm_b = 0.0
+        for i in range(a.shape[0]):
+            dot += a[i] * b[i]
+            norm_a += a[i] * a[i]
+            norm_b += b[i] * b[i]
+        
+        if norm_a == 0.0 or norm_b == 0.0:
+            return -1.0
+        
+        similarity = dot / np.sqrt(norm_a * norm_b)
+        similarity = min(max(similarity, -1.0), 1.0)
+        return 1.0 - similarity
+    
+    @numba.njit(cache=True, fastmath=True)
+    def _l2_nb(a, b):
+        """Euclidean distance in one pass"""
+        acc = 0.0
+        for i in range(a.shape[0]):
+            diff = a[i] - b[i]
+            acc += diff * diff
+        return np.sqrt(acc)
+
 class DeepFacialRecognitionService:
     def __init__(self):
         self.faces_db_path = "data/faces_db.pkl"
-        self.faces_info_path = "data/faces_info.json"
+        self.faces_info_path = "data/faces_info.json"  # JSON export (on demand)
+        self.faces_info_db_path = "data/faces.db"
         self.faces_embeddings_dir = "data/embeddings"
         self.faces_images_dir = "data/faces"
         
@@ -35,39 +86,75 @@ class DeepFacialRecognitionService:
         os.makedirs(self.faces_embeddings_dir, exist_ok=True)
         os.makedirs(self.faces_images_dir, exist_ok=True)
         
+        # Face info storage (SQLite, imports faces_info.json on first run)
+        self.faces_info_db = FacesInfoDatabase(self.faces_info_db_path, legacy_json_path=self.faces_info_path)
+        
         # Load existing face database
         # Thay đổi cấu trúc database
         # Từ: {name: {'embedding': array, 'image_path': str, ...}}
         # Thành: {name: {'embeddings': [array1, array2, ...], 'images': [path1, path2, ...], ...}}
         self.known_faces = {}
+        
+        # Stacked embedding matrix for one batched scan (built lazily, only for large galleries)
+        self._gallery = None
+        
         self.load_known_faces()
         
+        # Recognition models built once and reused for every embedding
+        self._models = {}
+        
+        # Serializes detection + embedding inference (callers may run on the event loop or in worker threads)
+        self._inference_lock = threading.Lock()
+        
+        # ONNX Runtime session for the embedding model (None = use DeepFace/TensorFlow)
+        self.onnx_input_name = None
+        self.onnx_session = self._initialize_onnx_session()
+        
         # Initialize models (warm up)
         self._initialize_models()
     
+    def _initialize_onnx_session(self) -> Optional[ort.InferenceSession]:
+        """Load exported ONNX embedding model with the best available execution provider"""
+        model_path = ONNX_CONFIG['model_path']
+        if not os.path.exists(model_path):
+            logger.info(f"ONNX model not found at {model_path}, using DeepFace (TensorFlow) for embeddings")
+            return None
+        
+        try:
+            available_providers = ort.get_available_providers()
+            providers = [p for p in ONNX_CONFIG['providers'] if p in available_providers]
+            
+            opts = ort.SessionOptions()
+            opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            
+            session = ort.InferenceSession(model_path, sess_options=opts, providers=providers)
+            self.onnx_input_name = session.get_inputs()[0].name
+            
+            logger.info(f"ONNX Runtime session initialized for {ONNX_CONFIG['model_name']} (providers: {session.get_providers()})")
+            return session
+            
+        except Exception as e:
+            logger.warning(f"Failed to initialize ONNX Runtime session, using DeepFace: {e}")
+            return None
+    
     def _initialize_models(self):
         """Initialize DeepFace models to reduce first-time loading delay"""
         try:
             logger.info("Initializing DeepFace models...")
             
-            # Create a small test image
-            test_image = np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8)
-            
-            # Warm up the models
+            # Build and warm up the models
             for model_name in ['Facenet', 'Facenet512']:
+                # Embeddings for this model come from the ONNX session: don't load the TensorFlow model
+                if self.onnx_session is not None and model_name == ONNX_CONFIG['model_name']:
+                    logger.info(f"Skipping TensorFlow warm-up for {model_name} (ONNX Runtime)")
+                    continue
+                
                 try:
-                    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
-                        cv2.imwrite(tmp_file.name, cv2.cvtColor(test_image, cv2.COLOR_RGB2BGR))
-                        
-                        DeepFace.represent(
-                            img_path=tmp_file.name,
-                            model_name=model_name,
-                            detector_backend='opencv',
-                            enforce_detection=False
-                        )
-                        logger.info(f"Model {model_name} initialized successfully")
-                        
-                    os.unlink(tmp_file.name)
+                    model = self._get_model(model_name)
+                    
+                    test_input = np.zeros((1, model.input_shape[0], model.input_shape[1], 3), dtype=np.float32)
+                    model.forward(test_input)
+                    logger.info(f"Model {model_name} initialized successfully")
                     
                 except Exception as e:
                     logger.warning(f"Failed to initialize {model_name}: {e}")
@@ -83,6 +170,18 @@ class DeepFacialRecognitionService:
             if os.path.exists(self.faces_db_path):
                 with open(self.faces_db_path, 'rb') as f:
                     self.known_faces = pickle.load(f)
+                self._gallery = None
+                
+                # Embeddings are kept in float16 (databases saved by older versions hold float32/float64)
+                for known_data in self.known_faces.values():
+                    if 'embeddings' in known_data:
+                        known_data['embeddings'] = [
+                            np.asarray(e, dtype=np.float16) if e is not None else None
+                            for e in known_data['embeddings']
+                        ]
+                    if known_data.get('embedding') is not None:
+                        known_data['embedding'] = np.asarray(known_data['embedding'], dtype=np.float16)
+                
                 logger.info(f"Loaded {len(self.known_faces)} known faces from database")
             else:
                 logger.info("No existing face database found, starting fresh")
@@ -94,6 +193,9 @@ class DeepFacialRecognitionService:
     def save_known_faces(self):
         """Save known faces to database"""
         try:
+            # Every change to known_faces is saved here, so rebuild the gallery on next recognition
+            self._gallery = None
+            
             with open(self.faces_db_path, 'wb') as f:
                 pickle.dump(self.known_faces, f)
             logger.info("Face database saved successfully")
@@ -102,25 +204,9 @@ class DeepFacialRecognitionService:
             logger.error(f"Error saving face database: {e}")
     
     def save_face_info(self, name: str, image_path: str, model_name: str):
-        """Save face information to JSON file"""
+        """Save face information to database"""
         try:
-            face_info = {
-                'name': name,
-                'image_path': image_path,
-                'model_name': model_name,
-                'added_date': datetime.now().isoformat(),
-                'recognition_count': 0
-            }
-            
-            faces_info = []
-            if os.path.exists(self.faces_info_path):
-                with open(self.faces_info_path, 'r', encoding='utf-8') as f:
-                    faces_info = json.load(f)
-            
-            faces_info.append(face_info)
-            
-            with open(self.faces_info_path, 'w', encoding='utf-8') as f:
-                json.dump(faces_info, f, ensure_ascii=False, indent=2)
+            self.faces_info_db.add_variation(name, model_name, 'default', image_path, None)
                 
         except Exception as e:
             logger.error(f"Error saving face info: {e}")
@@ -178,22 +264,8 @@ class DeepFacialRecognitionService:
                     try:
                         logger.debug(f"Trying config: {attempt_config}")
                         
-                        # Extract embedding using DeepFace
-                        embedding = DeepFace.represent(
-                            img_path=temp_path,
-                            model_name=attempt_config['model_name'],
-                            detector_backend=attempt_config['detector_backend'],
-                            enforce_detection=attempt_config['enforce_detection'],
-                            align=attempt_config['align'],
-                            normalization=attempt_config['normalization']
-                        )
-                        
-                        # DeepFace returns list of embeddings (one per face)
-                        if not embedding:
-                            raise ValueError("No face embedding extracted")
-                        
-                        # Take the first face embedding
-                        embedding_vector = np.array(embedding[0]['embedding'])
+                        # Extract embedding (ONNX Runtime if available, else DeepFace)
+                        embedding_vector = self._embed(temp_path, attempt_config)
                         
                         logger.debug(f"Embedding extracted successfully: shape={embedding_vector.shape}")
                         return embedding_vector
@@ -215,6 +287,45 @@ class DeepFacialRecognitionService:
             logger.error(f"Error extracting face embedding: {e}")
             raise ValueError(f"Failed to extract face embedding: {e}")
     
+    def _get_model(self, model_name: str):
+        """Get DeepFace recognition model, building it only on first use"""
+        model = self._models.get(model_name)
+        if model is None:
+            model = DeepFace.build_model(model_name)
+            self._models[model_name] = model
+        return model
+    
+    def _embed(self, img_path: str, config: dict) -> np.ndarray:
+        """Run face detection + embedding model, return embedding of the first face"""
+        # Detector/model (Keras, ONNX session, self._models) are not shared across threads:
+        # batch enrollment runs in a worker thread while recognize runs on the event loop
+        with self._inference_lock:
+            use_onnx = self.onnx_session is not None and config['model_name'] == ONNX_CONFIG['model_name']
+            model = None if use_onnx else self._get_model(config['model_name'])
+            
+            # Detect and align face with DeepFace
+            face_objs = DeepFace.extract_faces(
+                img_path=img_path,
+                detector_backend=config['detector_backend'],
+                enforce_detection=config['enforce_detection'],
+                align=config['align']
+            )
+            
+            if not face_objs:
+                raise ValueError("No face embedding extracted")
+            
+            # Same preprocessing as DeepFace.represent: RGB face -> BGR, pad/resize to (1, H, W, 3), normalize
+            face = face_objs[0]['face'][:, :, ::-1]
+            target_size = ONNX_CONFIG['input_size'] if use_onnx else model.input_shape
+            tensor = preprocessing.resize_image(img=face, target_size=(target_size[1], target_size[0]))
+            tensor = preprocessing.normalize_input(img=tensor, normalization=config['normalization'])
+            
+            if use_onnx:
+                return self.onnx_session.run(None, {self.onnx_input_name: tensor.astype(np.float32)})[0][0]
+            
+            # Call the cached model directly instead of DeepFace.represent
+            return np.array(model.forward(tensor))
+    
     def _preprocess_image_for_face_detection(self, image: np.ndarray) -> np.ndarray:
         """Preprocess image to improve face detection"""
         try:
@@ -232,8 +343,7 @@ class DeepFacialRecognitionService:
                 logger.debug(f"Resized image from {width}x{height} to {new_width}x{new_height}")
             
             # Enhance contrast if image is too dark or bright
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            mean_brightness = np.mean(gray)
+            mean_brightness = _mean_brightness(image)
             
             if mean_brightness < 50:  # Too dark
                 # Brighten the image
@@ -287,6 +397,20 @@ class DeepFacialRecognitionService:
                 logger.warning("Inf values found in embeddings")
                 return 1.0
             
+            # JIT-compiled kernels when Numba is available
+            if numba is not None and metric in ('cosine', 'euclidean', 'euclidean_l2'):
+                if embedding1.shape != embedding2.shape:
+                    raise ValueError(f"Embedding shape mismatch: {embedding1.shape} vs {embedding2.shape}")
+                
+                if metric == 'cosine':
+                    cosine_distance = _cosine_nb(embedding1, embedding2)
+                    if cosine_distance < 0:
+                        logger.warning("Zero or NaN norm in cosine distance calculation")
+                        return 1.0
+                    return float(cosine_distance)
+                
+                return float(_l2_nb(embedding1, embedding2))
+            
             if metric == 'cosine':
                 # Cosine distance
                 dot_product = np.dot(embedding1, embedding2)
@@ -336,6 +460,71 @@ class DeepFacialRecognitionService:
             logger.error(f"Error calculating distance: {e}")
             return 1.0  # Return safe default value
     
+    def _build_gallery(self, dim: int) -> Dict:
+        """Stack all known embeddings of the given dimension into one matrix"""
+        rows = []
+        index = {}
+        for known_name, known_data in self.known_faces.items():
+            person_rows = []
+            for known_embedding in known_data.get('embeddings') or []:
+                if known_embedding is not None and np.shape(known_embedding) == (dim,):
+                    person_rows.append(len(rows))
+                    rows.append(known_embedding)
+                else:
+                    # Khác kích thước (model khác) -> so sánh từng cặp bằng calculate_distance
+                    person_rows.append(None)
+            index[known_name] = person_rows
+        
+        matrix = np.asarray(rows, dtype=np.float32).reshape(len(rows), dim)
+        norms = np.linalg.norm(matrix, axis=1)
+        valid = np.all(np.isfinite(matrix), axis=1) & (norms > 0)
+        
+        return {
+            'dim': dim,
+            'size': len(rows),
+            'index': index,
+            'valid': valid,
+            'matrix': matrix,
+            'norms': norms
+        }
+    
+    def _gallery_distances(self, query: np.ndarray, metric: str) -> Optional[Tuple[np.ndarray, Dict]]:
+        """
+        Distances from query to every gallery row in one matrix operation (BLAS is already multithreaded)
+        Returns None when the pair-by-pair path should be used instead
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        query_norm = float(np.linalg.norm(query))
+        if metric not in ('cosine', 'euclidean', 'euclidean_l2') or not np.all(np.isfinite(query)) or query_norm == 0:
+            return None
+        
+        dim = query.shape[0]
+        gallery = self._gallery
+        if gallery is None or gallery['dim'] != dim:
+            # Small gallery: BLAS dispatch costs more than the per-vector kernels, don't build the matrix at all
+            n_embeddings = sum(len(known_data.get('embeddings') or []) for known_data in self.known_faces.values())
+            if n_embeddings * dim < BATCH_SCAN_MIN_WORK:
+                return None
+            gallery = self._gallery = self._build_gallery(dim)
+        
+        # Embeddings of another dimension are not in the matrix
+        if gallery['size'] * dim < BATCH_SCAN_MIN_WORK:
+            return None
+        
+        if metric == 'cosine':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                similarity = (gallery['matrix'] @ query) / (gallery['norms'] * query_norm)
+            distances = 1.0 - np.clip(similarity, -1.0, 1.0)
+        else:
+            distances = np.linalg.norm(gallery['matrix'] - query, axis=1)
+        
+        distances = distances.astype(np.float64)
+        
+        # Same safe default as calculate_distance for invalid (zero / NaN) embeddings
+        distances[~gallery['valid']] = 1.0
+        
+        return distances, gallery['index']
+    
     def add_face(self, name: str, image_base64: str) -> Dict:
         """Add a new face to the database"""
         try:
@@ -380,7 +569,7 @@ class DeepFacialRecognitionService:
             
             # Add to database
             self.known_faces[name] = {
-                'embedding': embedding,
+                'embedding': embedding.astype(np.float16),
                 'image_path': image_path,
                 'model': config['model_name'],
                 'added_date': datetime.now().isoformat()
@@ -404,77 +593,30 @@ class DeepFacialRecognitionService:
             logger.error(f"Error adding face: {e}")
             raise ValueError(str(e))
     
-    def add_face_embedding(self, name: str, image_base64: str, variation_type: str = "default") -> Dict:
+    def add_face_embedding(self, name: str, image: Union[str, bytes], variation_type: str = "default") -> Dict:
         """
         Thêm một embedding mới cho người dùng đã tồn tại hoặc tạo mới
+        image: chuỗi base64 (data URL) hoặc bytes ảnh đã encode (JPEG/PNG)
         """
         try:
             logger.info(f"Adding face embedding for: {name} (variation: {variation_type})")
             
-            # Decode image
-            rgb_image = decode_base64_image(image_base64)
-            
-            # Validate image quality
-            if not self._validate_image_for_face_detection(rgb_image):
-                raise ValueError("Image quality is not suitable for face detection")
-            
             # Use enrollment configuration for better accuracy
             config = ENROLLMENT_CONFIG.copy()
             
-            # Extract face embedding
-            embedding = self.extract_face_embedding(rgb_image, config)
-            
-            # Validate embedding
-            if embedding is None or len(embedding) == 0:
-                raise ValueError("Failed to extract valid face embedding")
-            
-            if np.any(np.isnan(embedding)) or np.any(np.isinf(embedding)):
-                raise ValueError("Invalid embedding values detected")
-            
-            # Generate file name
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            image_filename = f"{name}_{variation_type}_{timestamp}.jpg"
+            prepared = self._prepare_face_embedding(name, image, variation_type, config)
             
             # Upload to Supabase Storage
-            image_url = supabase_service.upload_image(image_base64, image_filename)
+            image_url = supabase_service.upload_image(prepared['image_bytes'], prepared['image_filename'])
             
             if not image_url:
                 raise ValueError("Failed to upload image to cloud storage")
             
-            # Also save locally as backup (optional)
-            local_image_path = os.path.join(self.faces_images_dir, image_filename)
-            img_bgr = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR)
-            cv2.imwrite(local_image_path, img_bgr)
-            
-            # Save embedding to file
-            embedding_path = os.path.join(self.faces_embeddings_dir, f"{name}_{variation_type}_{timestamp}.npy")
-            np.save(embedding_path, embedding)
-            
-            # Add to database
-            if name not in self.known_faces:
-                self.known_faces[name] = {
-                    'embeddings': [],
-                    'images': [],
-                    'image_urls': [],  # New field for Supabase URLs
-                    'variations': [],
-                    'model': config['model_name'],
-                    'added_date': datetime.now().isoformat(),
-                    'total_embeddings': 0
-                }
-            
-            # Add new embedding and URL
-            self.known_faces[name]['embeddings'].append(embedding)
-            self.known_faces[name]['images'].append(local_image_path)  # Local backup
-            self.known_faces[name]['image_urls'].append(image_url)     # Supabase URL
-            self.known_faces[name]['variations'].append(variation_type)
-            self.known_faces[name]['total_embeddings'] = len(self.known_faces[name]['embeddings'])
-            self.known_faces[name]['last_updated'] = datetime.now().isoformat()
+            total_variations = self._store_face_embedding(name, prepared, image_url, config['model_name'])
             
             # Save database
             self.save_known_faces()
-            self.save_face_info_multiple(name, local_image_path, image_url, config['model_name'], variation_type)
             
-            total_variations = len(self.known_faces[name]['embeddings'])
             logger.info(f"Successfully added embedding {total_variations} for {name} ({variation_type})")
             
             return {
@@ -491,53 +633,148 @@ class DeepFacialRecognitionService:
             logger.error(f"Error adding face embedding: {e}")
             raise ValueError(str(e))
     
-    def save_face_info_multiple(self, name: str, image_path: str, image_url: str, model_name: str, variation_type: str):
-        """Save face information with Supabase URL"""
+    async def add_face_embeddings(self, name: str, images: List[Tuple[str, Union[str, bytes]]]) -> Dict:
+        """
+        Thêm nhiều variation cùng lúc cho một người
+        images: danh sách (variation_type, image) - ảnh được upload song song trong một batch
+        """
         try:
-            faces_info = []
-            if os.path.exists(self.faces_info_path):
-                with open(self.faces_info_path, 'r', encoding='utf-8') as f:
-                    faces_info = json.load(f)
-            
-            # Find existing person
-            person_found = False
-            for person in faces_info:
-                if person['name'] == name:
-                    if 'variations' not in person:
-                        person['variations'] = []
-                    
-                    person['variations'].append({
-                        'type': variation_type,
-                        'image_path': image_path,      # Local backup
-                        'image_url': image_url,        # Supabase URL
-                        'added_date': datetime.now().isoformat()
-                    })
-                    person['total_variations'] = len(person['variations'])
-                    person['last_updated'] = datetime.now().isoformat()
-                    person_found = True
-                    break
+            logger.info(f"Adding {len(images)} face embeddings for: {name}")
             
-            # Create new person if not found
-            if not person_found:
-                new_person = {
-                    'name': name,
-                    'model_name': model_name,
-                    'added_date': datetime.now().isoformat(),
-                    'recognition_count': 0,
-                    'variations': [{
-                        'type': variation_type,
-                        'image_path': image_path,
-                        'image_url': image_url,
-                        'added_date': datetime.now().isoformat()
-                    }],
-                    'total_variations': 1,
-                    'last_updated': datetime.now().isoformat()
-                }
-                faces_info.append(new_person)
+            if not images:
+                raise ValueError("No images provided")
             
-            # Save file
-            with open(self.faces_info_path, 'w', encoding='utf-8') as f:
-                json.dump(faces_info, f, ensure_ascii=False, indent=2)
+            # Use enrollment configuration for better accuracy
+            config = ENROLLMENT_CONFIG.copy()
+            
+            # Decode + embedding are CPU-bound: run them off the event loop so other requests keep being served
+            prepared_list = []
+            for variation_type, image in images:
+                prepared_list.append(await asyncio.to_thread(
+                    self._prepare_face_embedding, name, image, variation_type, config
+                ))
+            
+            # Upload all variations in one batch over a shared connection
+            image_urls = await supabase_service.upload_images_async([
+                (prepared['image_filename'], prepared['image_bytes']) for prepared in prepared_list
+            ])
+            
+            added_variations = []
+            failed_variations = []
+            for prepared, image_url in zip(prepared_list, image_urls):
+                if not image_url:
+                    failed_variations.append(prepared['variation_type'])
+                    continue
+                
+                self._store_face_embedding(name, prepared, image_url, config['model_name'])
+                added_variations.append({
+                    "variation_type": prepared['variation_type'],
+                    "image_url": image_url
+                })
+            
+            if not added_variations:
+                raise ValueError("Failed to upload images to cloud storage")
+            
+            # Save database once for the whole batch
+            self.save_known_faces()
+            
+            total_variations = len(self.known_faces[name]['embeddings'])
+            logger.info(f"Successfully added {len(added_variations)} embeddings for {name}. Total: {total_variations}")
+            
+            return {
+                "success": True,
+                "name": name,
+                "added_variations": added_variations,
+                "failed_variations": failed_variations,
+                "total_variations": total_variations,
+                "model_used": config['model_name'],
+                "message": f"Added {len(added_variations)} variations for {name}. Total: {total_variations} variations"
+            }
+            
+        except Exception as e:
+            logger.error(f"Error adding face embeddings: {e}")
+            raise ValueError(str(e))
+    
+    def _prepare_face_embedding(self, name: str, image: Union[str, bytes], variation_type: str, config: dict) -> Dict:
+        """Decode, validate ảnh và trích xuất embedding (chưa upload/lưu)"""
+        # Decode image (base64 only decoded once, bytes reused for upload)
+        if isinstance(image, (bytes, bytearray)):
+            image_bytes = bytes(image)
+        else:
+            image_bytes = decode_base64_to_bytes(image)
+        rgb_image = decode_image_bytes(image_bytes)
+        
+        # Validate image quality
+        if not self._validate_image_for_face_detection(rgb_image):
+            raise ValueError("Image quality is not suitable for face detection")
+        
+        # Extract face embedding
+        embedding = self.extract_face_embedding(rgb_image, config)
+        
+        # Validate embedding
+        if embedding is None or len(embedding) == 0:
+            raise ValueError("Failed to extract valid face embedding")
+        
+        if np.any(np.isnan(embedding)) or np.any(np.isinf(embedding)):
+            raise ValueError("Invalid embedding values detected")
+        
+        # Generate file name (microseconds: batch items of the same type are prepared within one second)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        image_filename = f"{name}_{variation_type}_{timestamp}.jpg"
+        
+        return {
+            'variation_type': variation_type,
+            'image_bytes': image_bytes,
+            'rgb_image': rgb_image,
+            'embedding': embedding,
+            'timestamp': timestamp,
+            'image_filename': image_filename
+        }
+    
+    def _store_face_embedding(self, name: str, prepared: Dict, image_url: str, model_name: str) -> int:
+        """Lưu ảnh local, file embedding và thêm vào database (không ghi faces_db.pkl)"""
+        variation_type = prepared['variation_type']
+        
+        # Lưu embedding dạng float16: một nửa dung lượng (RAM, faces_db.pkl, .npy), độ chính xác vẫn đủ cho so sánh
+        embedding = np.asarray(prepared['embedding'], dtype=np.float16)
+        
+        # Also save locally as backup (optional)
+        local_image_path = os.path.join(self.faces_images_dir, prepared['image_filename'])
+        img_bgr = cv2.cvtColor(prepared['rgb_image'], cv2.COLOR_RGB2BGR)
+        cv2.imwrite(local_image_path, img_bgr)
+        
+        # Save embedding to file
+        embedding_path = os.path.join(self.faces_embeddings_dir, f"{name}_{variation_type}_{prepared['timestamp']}.npy")
+        np.save(embedding_path, embedding)
+        
+        # Add to database
+        if name not in self.known_faces:
+            self.known_faces[name] = {
+                'embeddings': [],
+                'images': [],
+                'image_urls': [],  # New field for Supabase URLs
+                'variations': [],
+                'model': model_name,
+                'added_date': datetime.now().isoformat(),
+                'total_embeddings': 0
+            }
+        
+        # Add new embedding and URL
+        self.known_faces[name]['embeddings'].append(embedding)
+        self.known_faces[name]['images'].append(local_image_path)  # Local backup
+        self.known_faces[name]['image_urls'].append(image_url)     # Supabase URL
+        self.known_faces[name]['variations'].append(variation_type)
+        self.known_faces[name]['total_embeddings'] = len(self.known_faces[name]['embeddings'])
+        self.known_faces[name]['last_updated'] = datetime.now().isoformat()
+        
+        self.save_face_info_multiple(name, local_image_path, image_url, model_name, variation_type)
+        
+        return self.known_faces[name]['total_embeddings']
+    
+    def save_face_info_multiple(self, name: str, image_path: str, image_url: str, model_name: str, variation_type: str):
+        """Save face information with Supabase URL"""
+        try:
+            self.faces_info_db.add_variation(name, model_name, variation_type, image_path, image_url)
                 
         except Exception as e:
             logger.error(f"Error saving face info: {e}")
@@ -656,6 +893,30 @@ class DeepFacialRecognitionService:
             raise ValueError(str(e))
     
     def recognize_face_multiple_embeddings(self, image_base64: str) -> Dict:
+        """
+        Nhận diện khuôn mặt từ ảnh base64 với nhiều embedding cho mỗi người
+        """
+        try:
+            rgb_image = decode_base64_image(image_base64)
+        except Exception as e:
+            logger.error(f"Error during face recognition: {e}")
+            raise ValueError(str(e))
+        
+        return self._recognize_rgb_image(rgb_image)
+    
+    def recognize_face_bytes(self, img_bytes: bytes) -> Dict:
+        """
+        Nhận diện khuôn mặt từ bytes ảnh đã encode (JPEG/PNG), bỏ qua bước base64
+        """
+        try:
+            rgb_image = decode_image_bytes(img_bytes)
+        except Exception as e:
+            logger.error(f"Error during face recognition: {e}")
+            raise ValueError(str(e))
+        
+        return self._recognize_rgb_image(rgb_image)
+    
+    def _recognize_rgb_image(self, rgb_image: np.ndarray) -> Dict:
         """
         Nhận diện khuôn mặt với nhiều embedding cho mỗi người
         """
@@ -673,9 +934,6 @@ class DeepFacialRecognitionService:
                     "message": "No faces in database"
                 }
             
-            # Decode image
-            rgb_image = decode_base64_image(image_base64)
-            
             # Use realtime configuration
             config = REALTIME_CONFIG.copy()
             
@@ -702,32 +960,53 @@ class DeepFacialRecognitionService:
             logger.info(f"Using threshold: {threshold} for model: {config['model_name']}")
             
             recognition_details = []
+            early_exit = False
+            
+            # Hằng số cho vòng lặp so sánh (tránh tra cứu dict và format log không cần thiết)
+            metric = config['distance_metric']
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
+            info_enabled = logger.isEnabledFor(logging.INFO)
+            
+            # Distances to the whole gallery at once for large galleries (None -> compare pair by pair)
+            gallery_result = self._gallery_distances(unknown_embedding, metric)
+            if gallery_result is not None:
+                gallery_distances, gallery_index = gallery_result
             
             for known_name, known_data in self.known_faces.items():
                 try:
                     # Validate known embeddings
-                    if 'embeddings' not in known_data or not known_data['embeddings']:
+                    embeddings = known_data.get('embeddings')
+                    if not embeddings:
                         logger.warning(f"No embeddings for {known_name}")
                         continue
                     
+                    variations = known_data['variations']
+                    n_variations = len(variations)
+                    
                     # So sánh với tất cả embedding của người này
                     person_best_distance = float('inf')
                     person_best_variation = None
+                    person_rows = gallery_index.get(known_name) if gallery_result is not None else None
                     
-                    for i, known_embedding in enumerate(known_data['embeddings']):
+                    for i, known_embedding in enumerate(embeddings):
                         if known_embedding is None:
                             continue
-                            
-                        # Calculate distance
-                        distance = self.calculate_distance(
-                            unknown_embedding, 
-                            known_embedding,
-                            config['distance_metric']
-                        )
                         
-                        variation_type = known_data['variations'][i] if i < len(known_data['variations']) else f"var_{i}"
+                        row = person_rows[i] if person_rows is not None and i < len(person_rows) else None
+                        if row is not None:
+                            distance = float(gallery_distances[row])
+                        else:
+                            # Calculate distance
+                            distance = self.calculate_distance(
+                                unknown_embedding, 
+                                known_embedding,
+                                metric
+                            )
                         
-                        logger.debug(f"Distance to {known_name}[{variation_type}]: {distance:.4f}")
+                        variation_type = variations[i] if i < n_variations else f"var_{i}"
+                        
+                        if debug_enabled:
+                            logger.debug(f"Distance to {known_name}[{variation_type}]: {distance:.4f}")
                         
                         # Lưu chi tiết cho debug
                         recognition_details.append({
@@ -748,7 +1027,14 @@ class DeepFacialRecognitionService:
                         best_match = known_name
                         best_variation = person_best_variation
                     
-                    logger.info(f"Best for {known_name}: {person_best_distance:.4f} ({person_best_variation})")
+                    if info_enabled:
+                        logger.info(f"Best for {known_name}: {person_best_distance:.4f} ({person_best_variation})")
+                    
+                    # Khớp rất chắc chắn (dưới một nửa ngưỡng) -> không cần so sánh những người còn lại
+                    if best_distance < threshold * 0.5:
+                        early_exit = True
+                        logger.info(f"Early exit: {best_match} is well below threshold")
+                        break
                         
                 except Exception as e:
                     logger.warning(f"Error comparing with {known_name}: {e}")
@@ -758,17 +1044,17 @@ class DeepFacialRecognitionService:
             if best_distance == float('inf'):
                 best_distance = 100.0
             else:
-                best_distance = float(np.clip(best_distance, 0.0, 100.0))
+                best_distance = _clip(best_distance, 0.0, 100.0)
             
             # Check if best match is within threshold
             if best_match and best_distance <= threshold:
                 # Calculate confidence
-                if config['distance_metric'] == 'cosine':
+                if metric == 'cosine':
                     confidence = max(0.0, (threshold - best_distance) / threshold)
                 else:
                     confidence = max(0.0, 1.0 - (best_distance / threshold))
                 
-                confidence = float(np.clip(confidence, 0.0, 1.0))
+                confidence = _clip(confidence, 0.0, 1.0)
                 
                 # Update recognition count
                 self.update_recognition_count(best_match)
@@ -781,9 +1067,10 @@ class DeepFacialRecognitionService:
                     "confidence": confidence,
                     "distance": best_distance,
                     "best_variation": best_variation,
-                    "threshold": float(threshold),
+                    "threshold": threshold,
                     "model_used": config['model_name'],
                     "total_comparisons": len(recognition_details),
+                    "early_exit": early_exit,
                     "recognition_details": recognition_details[:5],  # Top 5 để debug
                     "message": f"Welcome {best_match}! (matched with {best_variation} variation)"
                 }
@@ -796,9 +1083,10 @@ class DeepFacialRecognitionService:
                     "confidence": 0.0,
                     "distance": best_distance,
                     "best_variation": best_variation,
-                    "threshold": float(threshold),
+                    "threshold": threshold,
                     "model_used": config['model_name'],
                     "total_comparisons": len(recognition_details),
+                    "early_exit": early_exit,
                     "recognition_details": recognition_details[:5],  # Top 5 để debug
                     "message": f"Face not recognized (closest: {best_match}[{best_variation}])"
                 }
@@ -810,18 +1098,7 @@ class DeepFacialRecognitionService:
     def update_recognition_count(self, name: str):
         """Update recognition count for a face"""
         try:
-            if os.path.exists(self.faces_info_path):
-                with open(self.faces_info_path, 'r', encoding='utf-8') as f:
-                    faces_info = json.load(f)
-                
-                for face_info in faces_info:
-                    if face_info['name'] == name:
-                        face_info['recognition_count'] = face_info.get('recognition_count', 0) + 1
-                        face_info['last_recognized'] = datetime.now().isoformat()
-                        break
-                
-                with open(self.faces_info_path, 'w', encoding='utf-8') as f:
-                    json.dump(faces_info, f, ensure_ascii=False, indent=2)
+            self.faces_info_db.increment_recognition_count(name)
                     
         except Exception as e:
             logger.error(f"Error updating recognition count: {e}")
@@ -829,14 +1106,20 @@ class DeepFacialRecognitionService:
     def get_faces_info(self) -> List[Dict]:
         """Get information about all faces in database"""
         try:
-            if os.path.exists(self.faces_info_path):
-                with open(self.faces_info_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return []
+            return self.faces_info_db.get_all()
         except Exception as e:
             logger.error(f"Error getting faces info: {e}")
             return []
     
+    def export_faces_info_json(self) -> bool:
+        """Export faces info to faces_info.json"""
+        try:
+            self.faces_info_db.export_json(self.faces_info_path)
+            return True
+        except Exception as e:
+            logger.error(f"Error exporting faces info: {e}")
+            return False
+    
     def delete_face(self, name: str) -> bool:
         """Delete a face from the database"""
         try:
@@ -854,14 +1137,7 @@ class DeepFacialRecognitionService:
             self.save_known_faces()
             
             # Update faces info
-            if os.path.exists(self.faces_info_path):
-                with open(self.faces_info_path, 'r', encoding='utf-8') as f:
-                    faces_info = json.load(f)
-                
-                faces_info = [info for info in faces_info if info['name'] != name]
-                
-                with open(self.faces_info_path, 'w', encoding='utf-8') as f:
-                    json.dump(faces_info, f, ensure_ascii=False, indent=2)
+            self.faces_info_db.delete_person(name)
             
             logger.info(f"Face {name} deleted successfully")
             return True
@@ -926,25 +1202,9 @@ class DeepFacialRecognitionService:
             return False
     
     def _update_faces_info_after_variation_delete(self, name: str, variation_type: str):
-        """Update faces_info.json after deleting a variation"""
+        """Update faces info after deleting a variation"""
         try:
-            if os.path.exists(self.faces_info_path):
-                with open(self.faces_info_path, 'r', encoding='utf-8') as f:
-                    faces_info = json.load(f)
-                
-                for person in faces_info:
-                    if person['name'] == name:
-                        if 'variations' in person:
-                            person['variations'] = [
-                                v for v in person['variations'] 
-                                if v['type'] != variation_type
-                            ]
-                            person['total_variations'] = len(person['variations'])
-                            person['last_updated'] = datetime.now().isoformat()
-                        break
-                
-                with open(self.faces_info_path, 'w', encoding='utf-8') as f:
-                    json.dump(faces_info, f, ensure_ascii=False, indent=2)
+            self.faces_info_db.delete_variation(name, variation_type)
                     
         except Exception as e:
             logger.error(f"Error updating faces info after variation delete: {e}")
@@ -960,8 +1220,7 @@ class DeepFacialRecognitionService:
                 return False
             
             # Check if image is too dark or too bright
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            mean_brightness = np.mean(gray)
+            mean_brightness = _mean_brightness(image)
             
             if mean_brightness < 10 or mean_brightness > 245:
                 return False
@@ -972,57 +1231,6 @@ class DeepFacialRecognitionService:
             logger.warning(f"Error validating image: {e}")
             return False
     
-    def save_face_info_multiple(self, name: str, image_path: str, image_url: str, model_name: str, variation_type: str):
-        """Save face information with Supabase URL"""
-        try:
-            faces_info = []
-            if os.path.exists(self.faces_info_path):
-                with open(self.faces_info_path, 'r', encoding='utf-8') as f:
-                    faces_info = json.load(f)
-            
-            # Find existing person
-            person_found = False
-            for person in faces_info:
-                if person['name'] == name:
-                    if 'variations' not in person:
-                        person['variations'] = []
-                    
-                    person['variations'].append({
-                        'type': variation_type,
-                        'image_path': image_path,      # Local backup
-                        'image_url': image_url,        # Supabase URL
-                        'added_date': datetime.now().isoformat()
-                    })
-                    person['total_variations'] = len(person['variations'])
-                    person['last_updated'] = datetime.now().isoformat()
-                    person_found = True
-                    break
-            
-            # Create new person if not found
-            if not person_found:
-                new_person = {
-                    'name': name,
-                    'model_name': model_name,
-                    'added_date': datetime.now().isoformat(),
-                    'recognition_count': 0,
-                    'variations': [{
-                        'type': variation_type,
-                        'image_path': image_path,
-                        'image_url': image_url,
-                        'added_date': datetime.now().isoformat()
-                    }],
-                    'total_variations': 1,
-                    'last_updated': datetime.now().isoformat()
-                }
-                faces_info.append(new_person)
-            
-            # Save file
-            with open(self.faces_info_path, 'w', encoding='utf-8') as f:
-                json.dump(faces_info, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            logger.error(f"Error saving face info: {e}")
-
     def _safe_remove_temp_file(self, filepath: str, max_retries: int = 3):
         """Safely remove temporary file with retries"""
         import time
@@ -1056,12 +1264,18 @@ class DeepFacialRecognitionService:
 facial_recognition_service = DeepFacialRecognitionService()
 
 # Wrapper functions for backward compatibility
-def add_face(name: str, image: str, variation_type: str = "default"):
+def add_face(name: str, image: Union[str, bytes], variation_type: str = "default"):
     return facial_recognition_service.add_face_embedding(name, image, variation_type)
 
+async def add_faces(name: str, images: List[Tuple[str, Union[str, bytes]]]):
+    return await facial_recognition_service.add_face_embeddings(name, images)
+
 def recognize_face(image: str):
     return facial_recognition_service.recognize_face_multiple_embeddings(image)
 
+def recognize_face_bytes(image: bytes):
+    return facial_recognition_service.recognize_face_bytes(image)
+
 def get_faces_info():
     return facial_recognition_service.get_faces_info()
 
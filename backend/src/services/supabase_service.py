@@ -1,7 +1,9 @@
 import os
 import logging
 import base64
-from typing import Optional
+import asyncio
+import httpx
+from typing import List, Optional, Tuple, Union
 from supabase import create_client, Client
 from datetime import datetime
 from dotenv import load_dotenv
@@ -20,20 +22,28 @@ class SupabaseService:
         self.client: Client = create_client(self.supabase_url, self.supabase_key)
         self.bucket_name = "faces"
         
+        # Shared async HTTP/2 client for batch uploads (created lazily)
+        self._http_client: Optional[httpx.AsyncClient] = None
+        
         logger.info("Supabase service initialized")
     
-    def upload_image(self, image_base64: str, file_name: str) -> Optional[str]:
+    def upload_image(self, image: Union[str, bytes], file_name: str) -> Optional[str]:
         """
         Upload image to Supabase Storage
+        Accepts raw encoded bytes or a base64 string (with or without data URL prefix)
         Returns public URL if successful, None if failed
         """
         try:
-            # Remove data URL prefix if present
-            if image_base64.startswith('data:image'):
-                image_base64 = image_base64.split(',')[1]
-            
-            # Decode base64 to bytes
-            image_bytes = base64.b64decode(image_base64)
+            if isinstance(image, (bytes, bytearray)):
+                # Already raw bytes, no base64 round-trip needed
+                image_bytes = bytes(image)
+            else:
+                # Remove data URL prefix if present
+                if image.startswith('data:image'):
+                    image = image.split(',')[1]
+                
+                # Decode base64 to bytes
+                image_bytes = base64.b64decode(image)
             
             # Upload to Supabase Storage
             result = self.client.storage.from_(self.bucket_name).upload(
@@ -58,6 +68,53 @@ class SupabaseService:
             logger.error(f"Error uploading image to Supabase: {e}")
             return None
     
+    async def upload_images_async(self, items: List[Tuple[str, bytes]]) -> List[Optional[str]]:
+        """
+        Upload multiple images to Supabase Storage in parallel
+        Uploads are multiplexed over one reused HTTP/2 connection
+        Returns list of public URLs (None for failed uploads), same order as items
+        """
+        client = self._get_http_client()
+        return await asyncio.gather(*[
+            self._upload_one(client, file_name, image_bytes) for file_name, image_bytes in items
+        ])
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Get shared async HTTP client, creating it if needed"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                http2=True,
+                timeout=30.0,
+                headers={
+                    "Authorization": f"Bearer {self.supabase_key}",
+                    "apikey": self.supabase_key
+                }
+            )
+        return self._http_client
+    
+    async def _upload_one(self, client: httpx.AsyncClient, file_name: str, image_bytes: bytes) -> Optional[str]:
+        """Upload a single image using the given async client"""
+        try:
+            url = f"{self.supabase_url.rstrip('/')}/storage/v1/object/{self.bucket_name}/{file_name}"
+            response = await client.post(
+                url,
+                content=image_bytes,
+                headers={
+                    "content-type": "image/jpeg",
+                    "cache-control": "max-age=3600",
+                    "x-upsert": "false"
+                }
+            )
+            response.raise_for_status()
+            
+            public_url = self.get_public_url(file_name)
+            logger.info(f"Image uploaded successfully: {file_name}")
+            return public_url
+            
+        except Exception as e:
+            logger.error(f"Error uploading image {file_name} to Supabase: {e}")
+            return None
+    
     def delete_image(self, file_name: str) -> bool:
         """Delete image from Supabase Storage"""
         try:
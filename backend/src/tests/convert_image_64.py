@@ -1,8 +1,15 @@
-import base64
+import pybase64
 import cv2
 import numpy as np
+import simplejpeg
 from PIL import Image
 import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 85 đủ cho nhận diện khuôn mặt, encode nhanh hơn và base64 ngắn hơn so với 95
+JPEG_QUALITY = 85
 
 def convert_image_to_base64(image_path: str) -> str:
     """
@@ -15,28 +22,28 @@ def convert_image_to_base64(image_path: str) -> str:
         str: Chuỗi base64 của ảnh với header `data:image/jpeg;base64,`.
     """
     try:
-        print(f"Đang xử lý ảnh: {image_path}")
+        logger.debug("Đang xử lý ảnh: %s", image_path)
         
         # Phương pháp 1: Sử dụng PIL (tốt hơn cho việc xử lý nhiều định dạng)
         with Image.open(image_path) as img:
-            print(f"Thông tin ảnh gốc: Mode={img.mode}, Size={img.size}")
+            logger.debug("Thông tin ảnh gốc: Mode=%s, Size=%s", img.mode, img.size)
             
             # Chuyển sang RGB nếu cần
             if img.mode != 'RGB':
-                print(f"Chuyển đổi từ {img.mode} sang RGB")
+                logger.debug("Chuyển đổi từ %s sang RGB", img.mode)
                 img = img.convert('RGB')
             
-            # Đảm bảo ảnh không quá lớn (resize nếu cần)
+            # Chuyển PIL Image thành numpy array
+            img_array = np.array(img, dtype=np.uint8)
+            logger.debug("Array shape: %s, dtype: %s", img_array.shape, img_array.dtype)
+            
+            # Đảm bảo ảnh không quá lớn (resize nếu cần, INTER_AREA nhanh và khử răng cưa tốt khi thu nhỏ)
             max_size = 1024
             if max(img.size) > max_size:
                 ratio = max_size / max(img.size)
                 new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-                print(f"Resize ảnh về: {new_size}")
-            
-            # Chuyển PIL Image thành numpy array
-            img_array = np.array(img, dtype=np.uint8)
-            print(f"Array shape: {img_array.shape}, dtype: {img_array.dtype}")
+                img_array = cv2.resize(img_array, new_size, interpolation=cv2.INTER_AREA)
+                logger.debug("Resize ảnh về: %s", new_size)
             
             # Validate định dạng
             if len(img_array.shape) != 3 or img_array.shape[2] != 3:
@@ -45,27 +52,20 @@ def convert_image_to_base64(image_path: str) -> str:
             if img_array.dtype != np.uint8:
                 raise ValueError(f"Ảnh phải có định dạng uint8, nhận được: {img_array.dtype}")
             
-            # Chuyển RGB thành BGR cho OpenCV encode
-            img_bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            
-            # Encode thành JPEG
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 95]
-            success, buffer = cv2.imencode('.jpg', img_bgr, encode_param)
-            
-            if not success:
-                raise ValueError("Không thể encode ảnh thành JPEG")
+            # Encode thành JPEG (libjpeg-turbo, encode trực tiếp từ RGB, không cần chuyển sang BGR)
+            buffer = simplejpeg.encode_jpeg(img_array, quality=JPEG_QUALITY, colorspace='RGB', fastdct=True)
             
             # Encode thành base64
-            base64_image = base64.b64encode(buffer).decode("utf-8")
+            base64_image = pybase64.b64encode_as_string(buffer)
             
             # Thêm header
             result = f"data:image/jpeg;base64,{base64_image}"
-            print(f"Chuyển đổi thành công! Base64 length: {len(result)}")
+            logger.debug("Chuyển đổi thành công! Base64 length: %d", len(result))
             
             return result
             
     except Exception as e:
-        print(f"Lỗi với PIL, thử phương pháp OpenCV: {e}")
+        logger.warning("Lỗi với PIL, thử phương pháp OpenCV: %s", e)
         
         # Phương pháp 2: Fallback với OpenCV
         try:
@@ -73,7 +73,7 @@ def convert_image_to_base64(image_path: str) -> str:
             if img is None:
                 raise ValueError("OpenCV không thể đọc ảnh")
             
-            print(f"OpenCV - Shape: {img.shape}, dtype: {img.dtype}")
+            logger.debug("OpenCV - Shape: %s, dtype: %s", img.shape, img.dtype)
             
             # Đảm bảo định dạng uint8
             if img.dtype != np.uint8:
@@ -86,20 +86,16 @@ def convert_image_to_base64(image_path: str) -> str:
                 ratio = max_size / max(height, width)
                 new_width = int(width * ratio)
                 new_height = int(height * ratio)
-                img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
-                print(f"OpenCV - Resized to: {img.shape}")
-            
-            # Encode thành JPEG
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 95]
-            success, buffer = cv2.imencode('.jpg', img, encode_param)
+                img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+                logger.debug("OpenCV - Resized to: %s", img.shape)
             
-            if not success:
-                raise ValueError("OpenCV không thể encode ảnh")
+            # Encode thành JPEG (ảnh OpenCV là BGR)
+            buffer = simplejpeg.encode_jpeg(np.ascontiguousarray(img), quality=JPEG_QUALITY, colorspace='BGR', fastdct=True)
             
-            base64_image = base64.b64encode(buffer).decode("utf-8")
+            base64_image = pybase64.b64encode_as_string(buffer)
             result = f"data:image/jpeg;base64,{base64_image}"
             
-            print(f"OpenCV - Chuyển đổi thành công! Base64 length: {len(result)}")
+            logger.debug("OpenCV - Chuyển đổi thành công! Base64 length: %d", len(result))
             return result
             
         except Exception as e2:
@@ -110,17 +106,22 @@ def validate_base64_image(base64_string: str) -> bool:
     Kiểm tra tính hợp lệ của chuỗi base64 image
     """
     try:
-        if ',' in base64_string:
-            header, data = base64_string.split(',', 1)
+        if base64_string.startswith('data:'):
+            # Header ngắn, chỉ tìm ',' trong 64 ký tự đầu thay vì quét toàn bộ chuỗi
+            data = base64_string[base64_string.index(',', 0, 64) + 1:]
         else:
             data = base64_string
         
         # Decode base64
-        img_data = base64.b64decode(data)
+        img_data = pybase64.b64decode(data, validate=False)
         
-        # Thử decode bằng OpenCV
-        np_arr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        if simplejpeg.is_jpeg(img_data):
+            # JPEG: decode trực tiếp sang RGB bằng libjpeg-turbo
+            img = simplejpeg.decode_jpeg(img_data, colorspace='RGB')
+        else:
+            # Định dạng khác: thử decode bằng OpenCV
+            np_arr = np.frombuffer(img_data, np.uint8)
+            img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
         
         if img is None:
             return False
@@ -132,11 +133,11 @@ def validate_base64_image(base64_string: str) -> bool:
         if img.dtype != np.uint8:
             return False
         
-        print(f"Validation passed - Shape: {img.shape}, dtype: {img.dtype}")
+        logger.debug("Validation passed - Shape: %s, dtype: %s", img.shape, img.dtype)
         return True
         
     except Exception as e:
-        print(f"Validation failed: {e}")
+        logger.debug("Validation failed: %s", e)
         return False
 
 # Test function
@@ -173,29 +174,31 @@ def test_decode(base64_string: str):
     """Test decode lại ảnh để đảm bảo đúng định dạng"""
     try:
         # Tách header
-        if ',' in base64_string:
-            header, data = base64_string.split(',', 1)
+        if base64_string.startswith('data:'):
+            # Header ngắn, chỉ tìm ',' trong 64 ký tự đầu thay vì quét toàn bộ chuỗi
+            data = base64_string[base64_string.index(',', 0, 64) + 1:]
         else:
             data = base64_string
         
         # Decode
-        img_data = base64.b64decode(data)
-        np_arr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise ValueError("Decode thất bại")
+        img_data = pybase64.b64decode(data, validate=False)
         
-        # Chuyển BGR sang RGB (như trong face_recognition)
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        if simplejpeg.is_jpeg(img_data):
+            img = simplejpeg.decode_jpeg(img_data, colorspace='RGB')
+        else:
+            np_arr = np.frombuffer(img_data, np.uint8)
+            img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+            
+            if img is None:
+                raise ValueError("Decode thất bại")
         
+        # Chỉ kiểm tra shape/dtype/range nên không cần chuyển BGR sang RGB
         print(f"Decode success:")
-        print(f"- BGR shape: {img.shape}, dtype: {img.dtype}")
-        print(f"- RGB shape: {img_rgb.shape}, dtype: {img_rgb.dtype}")
-        print(f"- RGB range: [{img_rgb.min()}, {img_rgb.max()}]")
+        print(f"- Shape: {img.shape}, dtype: {img.dtype}")
+        print(f"- Range: [{img.min()}, {img.max()}]")
         
         # Kiểm tra face_recognition compatibility
-        if len(img_rgb.shape) == 3 and img_rgb.shape[2] == 3 and img_rgb.dtype == np.uint8:
+        if len(img.shape) == 3 and img.shape[2] == 3 and img.dtype == np.uint8:
             print("✓ Tương thích với face_recognition")
         else:
             print("✗ Không tương thích với face_recognition")
@@ -204,4 +207,6 @@ def test_decode(base64_string: str):
         print(f"Test decode failed: {e}")
 
 if __name__ == "__main__":
+    # Đặt DEBUG để xem chi tiết từng bước encode/decode
+    logging.basicConfig(level=logging.INFO)
     test_conversion()
\ No newline at end of file
@@ -4,115 +4,137 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import requests
 import json
-import base64
+import pybase64
 import cv2
 import numpy as np
+import simplejpeg
 from PIL import Image
 import logging
-from typing import Optional
+import functools
+from typing import Callable, Optional, Union
 
 # Setup logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 BASE_URL = "http://localhost:8000/api"
 
+# JPEG quality for test images (85 is enough for face recognition, faster encode and smaller payload)
+JPEG_QUALITY = 85
+
+# Formats decoded directly by cv2.imread (others fall back to PIL)
+OPENCV_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+
+@functools.lru_cache(maxsize=4)
+def create_test_image_base64(method: str = 'opencv') -> str:
+    """Tạo ảnh test và chuyển thành base64 (ảnh cố định nên chỉ tạo một lần cho mỗi method)"""
+    try:
+        if method == 'opencv':
+            # Tạo ảnh test với OpenCV (BGR)
+            img = np.full((400, 400, 3), (200, 150, 100), dtype=np.uint8)  # BGR color
+            
+            # Vẽ một hình tròn đại diện cho khuôn mặt
+            cv2.circle(img, (200, 150), 80, (255, 220, 180), -1)  # Face
+            cv2.circle(img, (180, 130), 10, (0, 0, 0), -1)        # Left eye
+            cv2.circle(img, (220, 130), 10, (0, 0, 0), -1)        # Right eye
+            cv2.ellipse(img, (200, 180), (20, 10), 0, 0, 180, (0, 0, 0), 2)  # Mouth
+            
+            # Encode thành JPEG
+            encode_param = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 0, cv2.IMWRITE_JPEG_PROGRESSIVE, 0]
+            success, buffer = cv2.imencode('.jpg', img, encode_param)
+            
+            if not success:
+                raise ValueError("Failed to encode with OpenCV")
+            
+            base64_string = pybase64.b64encode_as_string(memoryview(buffer))  # zero-copy view of the cv2.imencode array
+            return f"data:image/jpeg;base64,{base64_string}"
+            
+        elif method == 'pil':
+            # Tạo ảnh test RGB (cùng màu nền với Image.new trước đây, không cần copy từ PIL)
+            img_array = np.full((400, 400, 3), (150, 200, 100), dtype=np.uint8)
+            
+            # Vẽ khuôn mặt trực tiếp trên ảnh RGB (màu theo thứ tự RGB)
+            cv2.circle(img_array, (200, 150), 80, (255, 220, 180), -1)  # Face
+            cv2.circle(img_array, (180, 130), 10, (0, 0, 0), -1)        # Left eye
+            cv2.circle(img_array, (220, 130), 10, (0, 0, 0), -1)        # Right eye
+            cv2.ellipse(img_array, (200, 180), (20, 10), 0, 0, 180, (0, 0, 0), 2)  # Mouth
+            
+            # Encode RGB trực tiếp (không cần chuyển sang BGR)
+            buffer = simplejpeg.encode_jpeg(img_array, quality=JPEG_QUALITY, colorspace='RGB', fastdct=True)
+            
+            base64_string = pybase64.b64encode_as_string(buffer)
+            return f"data:image/jpeg;base64,{base64_string}"
+        
+    except Exception as e:
+        raise ValueError(f"Failed to create test image with {method}: {e}")
+
+
 class APITester:
     def __init__(self):
         self.test_results = []
+        
+        # Reuse one keep-alive connection for all requests
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = 'application/json'
     
-    def log_test_result(self, test_name: str, success: bool, message: str, data: dict = None):
-        """Log test result"""
+    def log_test_result(self, test_name: str, success: bool, message: Union[str, Callable[[], str]], data: dict = None):
+        """
+        Log test result
+        message may be a callable: it is only formatted when the test fails (or DEBUG is enabled)
+        """
         result = {
             "test": test_name,
             "success": success,
-            "message": message,
-            "data": data or {}
+            "data": data
         }
+        
+        if not success or logger.isEnabledFor(logging.DEBUG):
+            result["message"] = message() if callable(message) else message
+        elif not callable(message):
+            result["message"] = message
+        
         self.test_results.append(result)
         
         status = "✓ PASS" if success else "✗ FAIL"
-        print(f"{status} {test_name}: {message}")
+        if "message" in result:
+            print(f"{status} {test_name}: {result['message']}")
+        else:
+            print(f"{status} {test_name}")
         
     def create_test_image_base64(self, method='opencv') -> str:
         """Tạo ảnh test và chuyển thành base64"""
-        try:
-            if method == 'opencv':
-                # Tạo ảnh test với OpenCV (BGR)
-                img = np.zeros((400, 400, 3), dtype=np.uint8)
-                img[:] = (200, 150, 100)  # BGR color
-                
-                # Vẽ một hình tròn đại diện cho khuôn mặt
-                cv2.circle(img, (200, 150), 80, (255, 220, 180), -1)  # Face
-                cv2.circle(img, (180, 130), 10, (0, 0, 0), -1)        # Left eye
-                cv2.circle(img, (220, 130), 10, (0, 0, 0), -1)        # Right eye
-                cv2.ellipse(img, (200, 180), (20, 10), 0, 0, 180, (0, 0, 0), 2)  # Mouth
-                
-                # Encode thành JPEG
-                encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 95]
-                success, buffer = cv2.imencode('.jpg', img, encode_param)
-                
-                if not success:
-                    raise ValueError("Failed to encode with OpenCV")
-                
-                base64_string = base64.b64encode(buffer).decode('utf-8')
-                return f"data:image/jpeg;base64,{base64_string}"
-                
-            elif method == 'pil':
-                # Tạo ảnh test với PIL (RGB)
-                img = Image.new('RGB', (400, 400), color=(150, 200, 100))
-                
-                # Convert to numpy for drawing (RGB)
-                img_array = np.array(img)
-                
-                # Chuyển sang BGR cho OpenCV drawing
-                img_bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-                
-                # Vẽ khuôn mặt
-                cv2.circle(img_bgr, (200, 150), 80, (180, 220, 255), -1)  # Face
-                cv2.circle(img_bgr, (180, 130), 10, (0, 0, 0), -1)        # Left eye
-                cv2.circle(img_bgr, (220, 130), 10, (0, 0, 0), -1)        # Right eye
-                cv2.ellipse(img_bgr, (200, 180), (20, 10), 0, 0, 180, (0, 0, 0), 2)  # Mouth
-                
-                # Encode
-                success, buffer = cv2.imencode('.jpg', img_bgr)
-                if not success:
-                    raise ValueError("Failed to encode with PIL method")
-                
-                base64_string = base64.b64encode(buffer).decode('utf-8')
-                return f"data:image/jpeg;base64,{base64_string}"
-            
-        except Exception as e:
-            raise ValueError(f"Failed to create test image with {method}: {e}")
+        return create_test_image_base64(method)
     
     def load_real_image_base64(self, image_path: str) -> Optional[str]:
         """Load real image file and convert to base64"""
         try:
-            # Method 1: PIL
-            with Image.open(image_path) as img:
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Resize if too large
-                max_size = 800
-                if max(img.size) > max_size:
-                    ratio = max_size / max(img.size)
-                    new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-                    img = img.resize(new_size, Image.Resampling.LANCZOS)
-                
-                # Convert to numpy array
-                img_array = np.array(img, dtype=np.uint8)
-                
-                # Convert RGB to BGR for OpenCV
-                img_bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-                
-                # Encode
-                success, buffer = cv2.imencode('.jpg', img_bgr)
-                if not success:
-                    raise ValueError("Failed to encode image")
-                
-                base64_string = base64.b64encode(buffer).decode('utf-8')
-                return f"data:image/jpeg;base64,{base64_string}"
+            if os.path.splitext(image_path)[1].lower() in OPENCV_IMAGE_EXTENSIONS:
+                # Method 1: OpenCV (already BGR, no PIL decode / mode convert / numpy copy)
+                img_array = cv2.imread(image_path, cv2.IMREAD_COLOR)
+                if img_array is None:
+                    raise ValueError(f"OpenCV cannot read image: {image_path}")
+                colorspace = 'BGR'
+            else:
+                # Method 2: PIL for formats OpenCV does not read
+                with Image.open(image_path) as img:
+                    if img.mode != 'RGB':
+                        img = img.convert('RGB')
+                    img_array = np.array(img, dtype=np.uint8)
+                colorspace = 'RGB'
+            
+            # Resize if too large (INTER_AREA for downscale)
+            height, width = img_array.shape[:2]
+            max_size = 800
+            if max(height, width) > max_size:
+                ratio = max_size / max(height, width)
+                new_size = (int(width * ratio), int(height * ratio))
+                img_array = cv2.resize(img_array, new_size, interpolation=cv2.INTER_AREA)
+            
+            # Encode in the decoded channel order (no color conversion copy)
+            buffer = simplejpeg.encode_jpeg(img_array, quality=JPEG_QUALITY, colorspace=colorspace, fastdct=True)
+            
+            base64_string = pybase64.b64encode_as_string(buffer)
+            return f"data:image/jpeg;base64,{base64_string}"
                 
         except Exception as e:
             logger.error(f"Failed to load real image: {e}")
@@ -121,111 +143,101 @@ class APITester:
     def validate_base64_image(self, base64_string: str) -> dict:
         """Validate base64 image"""
         try:
-            # Parse header
-            if ',' in base64_string:
-                header, data = base64_string.split(',', 1)
+            # Parse header (data URL prefix is short, only look for ',' in the first 64 chars)
+            if base64_string.startswith('data:'):
+                comma = base64_string.index(',', 0, 64)
+                header, data = base64_string[:comma], base64_string[comma + 1:]
             else:
                 header = "no-header"
                 data = base64_string
             
             # Decode base64
-            img_data = base64.b64decode(data)
+            img_data = pybase64.b64decode(data, validate=False)
             
-            # Try to decode with OpenCV
-            np_arr = np.frombuffer(img_data, np.uint8)
-            img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-            
-            if img is None:
-                return {"valid": False, "error": "OpenCV decode failed"}
+            if simplejpeg.is_jpeg(img_data):
+                # Decode JPEG directly (libjpeg-turbo)
+                img = simplejpeg.decode_jpeg(img_data, colorspace='RGB')
+            else:
+                # Other formats: decode with OpenCV
+                # (BGR is fine here: the checks below do not depend on channel order)
+                np_arr = np.frombuffer(img_data, np.uint8)
+                img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+                
+                if img is None:
+                    return {"valid": False, "error": "OpenCV decode failed"}
             
-            # Convert BGR to RGB for face_recognition
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            min_value, max_value = int(img.min()), int(img.max())
             
             # Validation checks
             checks = {
-                "has_3_dimensions": len(img_rgb.shape) == 3,
-                "has_3_channels": img_rgb.shape[2] == 3,
-                "is_uint8": img_rgb.dtype == np.uint8,
-                "min_size_ok": min(img_rgb.shape[:2]) >= 50,
-                "value_range_ok": img_rgb.min() >= 0 and img_rgb.max() <= 255
+                "has_3_dimensions": len(img.shape) == 3,
+                "has_3_channels": img.shape[2] == 3,
+                "is_uint8": img.dtype == np.uint8,
+                "min_size_ok": min(img.shape[:2]) >= 50,
+                "value_range_ok": min_value >= 0 and max_value <= 255
             }
             
             return {
                 "valid": all(checks.values()),
                 "header": header,
                 "data_length": len(img_data),
-                "image_shape": img_rgb.shape,
-                "image_dtype": str(img_rgb.dtype),
-                "value_range": [int(img_rgb.min()), int(img_rgb.max())],
+                "image_shape": img.shape,
+                "image_dtype": str(img.dtype),
+                "value_range": [min_value, max_value],
                 "checks": checks
             }
             
         except Exception as e:
             return {"valid": False, "error": str(e)}
     
-    def test_base64_validation(self):
-        """Test base64 image validation"""
-        print("\n=== TEST BASE64 VALIDATION ===")
-        
-        # Test 1: Synthetic image with OpenCV
+    def _run_validation_case(self, test_name: str, load_image):
+        """Load một ảnh base64 và validate"""
         try:
-            base64_opencv = self.create_test_image_base64('opencv')
-            validation = self.validate_base64_image(base64_opencv)
+            base64_image = load_image()
+            if not base64_image:
+                self.log_test_result(test_name, False, "Failed to load image")
+                return
             
-            self.log_test_result(
-                "Base64 OpenCV Image",
-                validation['valid'],
-                f"Validation: {validation}",
-                validation
-            )
-        except Exception as e:
-            self.log_test_result("Base64 OpenCV Image", False, str(e))
-        
-        # Test 2: Synthetic image with PIL
-        try:
-            base64_pil = self.create_test_image_base64('pil')
-            validation = self.validate_base64_image(base64_pil)
+            validation = self.validate_base64_image(base64_image)
             
             self.log_test_result(
-                "Base64 PIL Image",
+                test_name,
                 validation['valid'],
-                f"Validation: {validation}",
+                lambda: f"Validation: {validation}",
                 validation
             )
         except Exception as e:
-            self.log_test_result("Base64 PIL Image", False, str(e))
+            self.log_test_result(test_name, False, str(e))
+    
+    def test_base64_validation(self):
+        """Test base64 image validation"""
+        print("\n=== TEST BASE64 VALIDATION ===")
+        
+        cases = [
+            # Test 1: Synthetic image with OpenCV
+            ("Base64 OpenCV Image", lambda: self.create_test_image_base64('opencv')),
+            # Test 2: Synthetic image with PIL
+            ("Base64 PIL Image", lambda: self.create_test_image_base64('pil'))
+        ]
         
         # Test 3: Real image if exists
         real_image_path = "D:\\MinhThanh\\Music\\Pictures\\Screenshots\\Screenshot 2025-08-16 001222.png"
         if os.path.exists(real_image_path):
-            try:
-                base64_real = self.load_real_image_base64(real_image_path)
-                if base64_real:
-                    validation = self.validate_base64_image(base64_real)
-                    
-                    self.log_test_result(
-                        "Base64 Real Image",
-                        validation['valid'],
-                        f"Validation: {validation}",
-                        validation
-                    )
-                else:
-                    self.log_test_result("Base64 Real Image", False, "Failed to load real image")
-            except Exception as e:
-                self.log_test_result("Base64 Real Image", False, str(e))
+            cases.append(("Base64 Real Image", lambda: self.load_real_image_base64(real_image_path)))
+        
+        for name, load_image in cases:
+            self._run_validation_case(name, load_image)
     
     def test_api_endpoint(self, endpoint: str, method: str = "GET", data: dict = None) -> dict:
         """Test API endpoint"""
         try:
             url = f"{BASE_URL}{endpoint}"
             
-            if method.upper() == "GET":
-                response = requests.get(url, timeout=30)
-            elif method.upper() == "POST":
-                response = requests.post(url, json=data, timeout=30)
-            else:
+            if method.upper() not in ("GET", "POST"):
                 raise ValueError(f"Unsupported method: {method}")
             
+            response = self.session.request(method.upper(), url, json=data, timeout=30)
+            
             return {
                 "success": response.status_code == 200,
                 "status_code": response.status_code,
@@ -238,6 +250,15 @@ class APITester:
                 "error": str(e)
             }
     
+    def _log_api_result(self, test_name: str, result: dict, success_message: str = None):
+        """Log result of test_api_endpoint (response body is only formatted when needed)"""
+        if success_message and result.get('success'):
+            message = f"Status: {result.get('status_code', 'N/A')}, Response: {success_message}"
+        else:
+            message = lambda: f"Status: {result.get('status_code', 'N/A')}, Response: {result.get('response', result.get('error', 'N/A'))}"
+        
+        self.log_test_result(test_name, result['success'], message, result)
+    
     def test_face_api(self):
         """Test face recognition API"""
         print("\n=== TEST FACE RECOGNITION API ===")
@@ -262,66 +283,37 @@ class APITester:
         }
         
         result = self.test_api_endpoint("/faces/add", "POST", add_face_data)
-        self.log_test_result(
-            "Add Face API",
-            result['success'],
-            f"Status: {result.get('status_code', 'N/A')}, Response: {result.get('response', result.get('error', 'N/A'))}",
-            result
-        )
+        self._log_api_result("Add Face API", result)
         
-        # Test 2: Recognize face
+        # Test 2: Recognize face (phải chạy sau add face)
         recognize_data = {
             "image": base64_image
         }
         
         result = self.test_api_endpoint("/faces/recognize", "POST", recognize_data)
-        self.log_test_result(
-            "Recognize Face API",
-            result['success'],
-            f"Status: {result.get('status_code', 'N/A')}, Response: {result.get('response', result.get('error', 'N/A'))}",
-            result
-        )
+        self._log_api_result("Recognize Face API", result)
         
-        # Test 3: Get faces info
+        # Test 3: Get faces info (sau add face để kết quả ổn định)
         result = self.test_api_endpoint("/faces/info", "GET")
-        self.log_test_result(
-            "Get Faces Info API",
-            result['success'],
-            f"Status: {result.get('status_code', 'N/A')}, Response: {result.get('response', result.get('error', 'N/A'))}",
-            result
-        )
+        self._log_api_result("Get Faces Info API", result)
     
     def test_camera_api(self):
         """Test camera API"""
         print("\n=== TEST CAMERA API ===")
         
+        # Chạy tuần tự: liệt kê camera sẽ mở thử từng thiết bị, không chạy cùng lúc với select
         # Test 1: Get available cameras
         result = self.test_api_endpoint("/cameras", "GET")
-        self.log_test_result(
-            "Get Cameras API",
-            result['success'],
-            f"Status: {result.get('status_code', 'N/A')}, Response: {result.get('response', result.get('error', 'N/A'))}",
-            result
-        )
+        self._log_api_result("Get Cameras API", result)
         
         # Test 2: Select camera
         camera_data = {"camera_id": 0}
         result = self.test_api_endpoint("/cameras/select", "POST", camera_data)
-        self.log_test_result(
-            "Select Camera API",
-            result['success'],
-            f"Status: {result.get('status_code', 'N/A')}, Response: {result.get('response', result.get('error', 'N/A'))}",
-            result
-        )
+        self._log_api_result("Select Camera API", result)
         
         # Test 3: Get camera frame
         result = self.test_api_endpoint("/camera/frame", "GET")
-        self.log_test_result(
-            "Get Camera Frame API",
-            result['success'],
-            f"Status: {result.get('status_code', 'N/A')}, Response: {'Frame data received' if result.get('success') else result.get('response', result.get('error', 'N/A'))}",
-            result
-        )
+        self._log_api_result("Get Camera Frame API", result, success_message='Frame data received')
     
     def run_all_tests(self):
         """Run all tests"""
@@ -332,7 +324,7 @@ class APITester:
         
         # Test server connectivity
         try:
-            response = requests.get(f"http://localhost:8000/", timeout=5)
+            response = self.session.get(f"http://localhost:8000/", timeout=5)
             if response.status_code == 200:
                 self.log_test_result("Server Connectivity", True, "Server is running")
             else:
@@ -342,7 +334,7 @@ class APITester:
             self.log_test_result("Server Connectivity", False, f"Cannot connect to server: {e}")
             return
         
-        # Run tests
+        # Run tests (sections run one after another: readable output, one thread on the shared session)
         self.test_base64_validation()
         self.test_face_api()
         self.test_camera_api()
@@ -369,4 +361,7 @@ class APITester:
 if __name__ == "__main__":
     import time
     tester = APITester()
-    tester.run_all_tests()
\ No newline at end of file
+    try:
+        tester.run_all_tests()
+    finally:
+        tester.session.close()
\ No newline at end of file
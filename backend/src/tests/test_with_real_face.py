@@ -3,21 +3,34 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import orjson
 import base64
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw
 import logging
 import time
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 BASE_URL = "http://localhost:8000/api"
 
-def create_better_test_face():
-    """Tạo ảnh khuôn mặt realistic hơn"""
+# Shared keep-alive session for all API calls
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Payloads are serialized with orjson and sent as raw bytes
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Ảnh khuôn mặt test vẽ sẵn (PNG, BGR) - tạo lại bằng _draw_test_face nếu thay đổi hình vẽ
+TEST_FACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "test_face.png")
+
+def _draw_test_face() -> np.ndarray:
+    """Vẽ ảnh khuôn mặt test (RGB 400x400) bằng OpenCV"""
     # Tạo ảnh nền
     img = np.ones((400, 400, 3), dtype=np.uint8) * 240  # Light background
     
@@ -67,17 +80,29 @@ def create_better_test_face():
     cv2.ellipse(img, (200, 120), (95, 60), 0, 0, 180, (101, 67, 33), -1)
     
     # Chuyển BGR sang RGB
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+@functools.lru_cache(maxsize=1)
+def _make_test_face_bytes() -> bytes:
+    """Đọc ảnh khuôn mặt test (RGB 400x400) từ file PNG một lần, trả về bytes bất biến"""
+    img_bgr = cv2.imread(TEST_FACE_PATH, cv2.IMREAD_COLOR)
+    if img_bgr is None:
+        # Thiếu file asset: vẽ lại
+        return _draw_test_face().tobytes()
     
-    return img_rgb
+    return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB).tobytes()
+
+def create_better_test_face():
+    """Tạo ảnh khuôn mặt realistic hơn (vẽ một lần, mỗi lần gọi trả về một bản copy)"""
+    return np.frombuffer(_make_test_face_bytes(), dtype=np.uint8).reshape(400, 400, 3).copy()
 
 def test_with_camera_capture():
     """Test với ảnh từ camera"""
     try:
         # Bật camera để capture ảnh thật
-        response = requests.get(f"{BASE_URL}/camera/frame")
+        response = SESSION.get(f"{BASE_URL}/camera/frame")
         if response.status_code == 200:
-            frame_data = response.json()['frame']
+            frame_data = orjson.loads(response.content)['frame']
             print("✓ Captured frame from camera")
             return frame_data
     except Exception as e:
@@ -104,7 +129,7 @@ def test_add_face_with_different_images():
             base64_image = base64.b64encode(buffer).decode('utf-8')
             base64_image = f"data:image/jpeg;base64,{base64_image}"
             
-            test_cases.append(("Better Synthetic", base64_image))
+            test_cases.append(("Better Synthetic", base64_image, buffer.tobytes()))
     except Exception as e:
         print(f"✗ Failed to create better synthetic face: {e}")
     
@@ -113,7 +138,8 @@ def test_add_face_with_different_images():
         print("\n2. Testing with camera capture...")
         camera_image = test_with_camera_capture()
         if camera_image:
-            test_cases.append(("Camera Capture", camera_image))
+            # Chỉ có base64 từ server, không có JPEG bytes sẵn
+            test_cases.append(("Camera Capture", camera_image, None))
     except Exception as e:
         print(f"✗ Failed camera capture: {e}")
     
@@ -122,67 +148,83 @@ def test_add_face_with_different_images():
         print("\n3. Testing with real image file...")
         real_image_path = "D:\\MinhThanh\\Music\\Pictures\\Screenshots\\Screenshot 2025-08-16 001222.png"
         if os.path.exists(real_image_path):
-            with Image.open(real_image_path) as img:
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Resize
-                max_size = 800
-                if max(img.size) > max_size:
-                    ratio = max_size / max(img.size)
-                    new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-                    img = img.resize(new_size, Image.Resampling.LANCZOS)
-                
-                img_array = np.array(img, dtype=np.uint8)
-                img_bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+            # OpenCV đọc thẳng ra BGR (PNG/JPEG), không cần PIL / convert / cvtColor
+            img_bgr = cv2.imread(real_image_path, cv2.IMREAD_COLOR)
+            if img_bgr is None:
+                raise ValueError(f"Cannot read image: {real_image_path}")
+            
+            # Resize (INTER_AREA for downscale)
+            height, width = img_bgr.shape[:2]
+            max_size = 800
+            if max(height, width) > max_size:
+                ratio = max_size / max(height, width)
+                img_bgr = cv2.resize(img_bgr, (int(width * ratio), int(height * ratio)), interpolation=cv2.INTER_AREA)
+            
+            success, buffer = cv2.imencode('.jpg', img_bgr, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            if success:
+                base64_image = base64.b64encode(buffer).decode('utf-8')
+                base64_image = f"data:image/jpeg;base64,{base64_image}"
                 
-                success, buffer = cv2.imencode('.jpg', img_bgr)
-                if success:
-                    base64_image = base64.b64encode(buffer).decode('utf-8')
-                    base64_image = f"data:image/jpeg;base64,{base64_image}"
-                    
-                    test_cases.append(("Real Image File", base64_image))
+                test_cases.append(("Real Image File", base64_image, buffer.tobytes()))
     except Exception as e:
         print(f"✗ Failed to load real image: {e}")
     
-    # Run tests
-    for test_name, base64_image in test_cases:
-        print(f"\n📸 Testing: {test_name}")
+    # Run tests: build all payloads, then send the add-face requests concurrently
+    timestamp = int(time.time())
+    payloads = [
+        (test_name, base64_image, raw_jpeg_bytes, {
+            "name": f"TestUser_{test_name}_{timestamp}",
+            "image": base64_image
+        })
+        for test_name, base64_image, raw_jpeg_bytes in test_cases
+    ]
+    
+    if not payloads:
+        return
+    
+    with ThreadPoolExecutor(max_workers=min(len(payloads), 4)) as executor:
+        futures = {
+            executor.submit(SESSION.post, f"{BASE_URL}/faces/add", data=orjson.dumps(add_data), headers=JSON_HEADERS, timeout=30): (test_name, base64_image, raw_jpeg_bytes)
+            for test_name, base64_image, raw_jpeg_bytes, add_data in payloads
+        }
         
-        try:
-            # Test add face
-            add_data = {
-                "name": f"TestUser_{test_name}_{int(time.time())}",
-                "image": base64_image
-            }
-            
-            response = requests.post(f"{BASE_URL}/faces/add", json=add_data, timeout=30)
+        for future in as_completed(futures):
+            test_name, base64_image, raw_jpeg_bytes = futures[future]
+            print(f"\n📸 Testing: {test_name}")
             
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✓ SUCCESS: {result}")
-            else:
-                error_detail = response.json() if response.headers.get('content-type', '').startswith('application/json') else response.text
-                print(f"✗ FAILED: Status {response.status_code}")
-                print(f"  Error: {error_detail}")
+            try:
+                report_add_face_result(test_name, base64_image, raw_jpeg_bytes, future.result())
+            except Exception as e:
+                print(f"✗ EXCEPTION: {e}")
+
+def report_add_face_result(test_name: str, base64_image: str, raw_jpeg_bytes: Optional[bytes], response: requests.Response):
+    """In kết quả add face, lưu ảnh debug nếu thất bại (dùng JPEG bytes gốc nếu có, không decode lại base64)"""
+    if response.status_code == 200:
+        result = orjson.loads(response.content)
+        print(f"✓ SUCCESS: {result}")
+    else:
+        error_detail = orjson.loads(response.content) if response.headers.get('content-type', '').startswith('application/json') else response.text
+        print(f"✗ FAILED: Status {response.status_code}")
+        print(f"  Error: {error_detail}")
+        
+        # Debug: Save image to file for manual inspection
+        try:
+            img_data = raw_jpeg_bytes
+            if img_data is None:
+                data = base64_image
+                if data.startswith('data:'):
+                    comma = data.find(',', 0, 64)
+                    if comma > 0:
+                        data = data[comma + 1:]
                 
-                # Debug: Save image to file for manual inspection
-                try:
-                    if ',' in base64_image:
-                        _, data = base64_image.split(',', 1)
-                    else:
-                        data = base64_image
-                    
-                    img_data = base64.b64decode(data)
-                    debug_filename = f"debug_{test_name.replace(' ', '_')}.jpg"
-                    with open(debug_filename, 'wb') as f:
-                        f.write(img_data)
-                    print(f"  Debug image saved as: {debug_filename}")
-                except Exception as debug_e:
-                    print(f"  Could not save debug image: {debug_e}")
+                img_data = base64.b64decode(data)
             
-        except Exception as e:
-            print(f"✗ EXCEPTION: {e}")
+            debug_filename = f"debug_{test_name.replace(' ', '_')}.jpg"
+            with open(debug_filename, 'wb') as f:
+                f.write(img_data)
+            print(f"  Debug image saved as: {debug_filename}")
+        except Exception as debug_e:
+            print(f"  Could not save debug image: {debug_e}")
 
 def test_face_detection_locally():
     """Test face detection locally trước khi gửi API"""
@@ -250,7 +292,7 @@ def test_face_detection_locally():
 if __name__ == "__main__":
     # Test server connectivity
     try:
-        response = requests.get("http://localhost:8000/", timeout=5)
+        response = SESSION.get("http://localhost:8000/", timeout=5)
         if response.status_code != 200:
             print("❌ Server not running!")
             exit(1)
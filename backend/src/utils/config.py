@@ -1,3 +1,4 @@
+from dataclasses import make_dataclass
 from pydantic import BaseSettings
 
 class Settings(BaseSettings):
@@ -13,4 +14,13 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+# Settings validated once at import; plain slotted attribute access afterwards
+# (fields generated from Settings so the two never drift apart)
+FrozenSettings = make_dataclass(
+    "FrozenSettings",
+    [(name, field.outer_type_) for name, field in Settings.__fields__.items()],
+    frozen=True,
+    slots=True
+)
+
+settings = FrozenSettings(**Settings().dict())
@@ -1,13 +1,22 @@
-import base64
+import pybase64
+import binascii
 import cv2
 import numpy as np
 from PIL import Image
 import io
 import logging
-from typing import Optional, Tuple
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+import xxhash
 
 logger = logging.getLogger(__name__)
 
+# Decoded images cached by payload hash (client retries / repeated uploads skip decoding)
+DECODE_CACHE_SIZE = 16
+_decode_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+_decode_cache_lock = threading.Lock()
+
 def normalize_image_for_deepface(image: np.ndarray) -> np.ndarray:
     """
     Normalize image for DeepFace processing
@@ -18,6 +27,10 @@ def normalize_image_for_deepface(image: np.ndarray) -> np.ndarray:
     Returns:
         Normalized image in RGB format
     """
+    # Fast path: decode functions already return uint8 HxWx3 C-contiguous RGB
+    if image.dtype == np.uint8 and image.ndim == 3 and image.shape[2] == 3 and image.flags['C_CONTIGUOUS']:
+        return image
+    
     try:
         # Ensure image is in the right format
         if len(image.shape) == 3:
@@ -41,55 +54,129 @@ def normalize_image_for_deepface(image: np.ndarray) -> np.ndarray:
         if not image.flags['C_CONTIGUOUS']:
             image = np.ascontiguousarray(image)
         
-        logger.debug(f"Normalized image: shape={image.shape}, dtype={image.dtype}, range=[{image.min()}, {image.max()}]")
+        # min()/max() scan the whole image: only when DEBUG is enabled
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Normalized image: shape=%s, dtype=%s, range=[%d, %d]", image.shape, image.dtype, image.min(), image.max())
         return image
         
     except Exception as e:
         logger.error(f"Error normalizing image: {e}")
         raise ValueError(f"Failed to normalize image: {e}")
 
-def decode_base64_image(image_base64: str) -> np.ndarray:
+def decode_base64_to_bytes(image_base64: Union[str, bytes]) -> bytes:
     """
-    Decode base64 image to numpy array in RGB format
+    Decode base64 image string (with or without data URL header) to raw bytes
     
     Args:
-        image_base64: Base64 encoded image string
+        image_base64: Base64 encoded image string (str, or already ASCII-encoded bytes)
         
     Returns:
-        RGB image as numpy array
+        Encoded image bytes (JPEG/PNG/...)
     """
+    logger.debug("Decoding base64 image, length: %d", len(image_base64))
+    
+    payload = image_base64.encode() if isinstance(image_base64, str) else image_base64
+    data = memoryview(payload)
+    
+    # Remove header if present (short, so only the first 64 chars are scanned for ',');
+    # the memoryview slice skips it without copying the payload
+    if payload.startswith(b'data:'):
+        comma = payload.find(b',', 0, 64)
+        if comma > 0:
+            logger.debug("Removed header: %s", payload[:comma])
+            data = data[comma + 1:]
+    
+    # Decode base64 (SIMD decoder); only unpadded input pays for a padded copy
     try:
-        logger.debug(f"Decoding base64 image, length: {len(image_base64)}")
+        img_data = pybase64.b64decode(data, validate=False)
+    except binascii.Error:
+        # Extra '=' is ignored, so '==' covers any missing padding
+        img_data = pybase64.b64decode(bytes(data) + b'==', validate=False)
+    logger.debug("Decoded data length: %d", len(img_data))
+    
+    return img_data
+
+# Longest side accepted by decode_image_bytes (larger images are downscaled)
+MAX_IMAGE_SIZE = 2048
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, arithmetic), excluding DHT/JPG/DAC
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _jpeg_dimensions(img_data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read (width, height) from the JPEG SOF segment without decoding the image
+    
+    Returns:
+        (width, height), or None if the data is not a JPEG or the header cannot be parsed
+    """
+    if len(img_data) < 4 or img_data[0] != 0xFF or img_data[1] != 0xD8:
+        return None
+    
+    i = 2
+    length = len(img_data)
+    while i + 9 < length:
+        if img_data[i] != 0xFF:
+            return None
         
-        # Remove header if present
-        if ',' in image_base64:
-            header, image_base64 = image_base64.split(',', 1)
-            logger.debug(f"Removed header: {header}")
+        marker = img_data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
         
-        # Add padding if needed
-        missing_padding = len(image_base64) % 4
-        if missing_padding:
-            image_base64 += '=' * (4 - missing_padding)
+        if marker in _JPEG_SOF_MARKERS:
+            height = (img_data[i + 5] << 8) | img_data[i + 6]
+            width = (img_data[i + 7] << 8) | img_data[i + 8]
+            return width, height
         
-        # Decode base64
-        img_data = base64.b64decode(image_base64)
-        logger.debug(f"Decoded data length: {len(img_data)}")
+        # Skip segment (length includes its own 2 bytes)
+        i += 2 + ((img_data[i + 2] << 8) | img_data[i + 3])
+    
+    return None
+
+def _imdecode_flags(img_data: bytes) -> int:
+    """
+    Pick cv2.imdecode flags: for large JPEGs let libjpeg decode at 1/2, 1/4 or 1/8 scale
+    (the result is still at least MAX_IMAGE_SIZE on the longest side)
+    """
+    dimensions = _jpeg_dimensions(img_data)
+    if dimensions is None:
+        return cv2.IMREAD_COLOR
+    
+    longest = max(dimensions)
+    if longest >= MAX_IMAGE_SIZE * 8:
+        return cv2.IMREAD_REDUCED_COLOR_8
+    if longest >= MAX_IMAGE_SIZE * 4:
+        return cv2.IMREAD_REDUCED_COLOR_4
+    if longest >= MAX_IMAGE_SIZE * 2:
+        return cv2.IMREAD_REDUCED_COLOR_2
+    return cv2.IMREAD_COLOR
+
+def decode_image_bytes(img_data: bytes) -> np.ndarray:
+    """
+    Decode encoded image bytes to numpy array in RGB format
+    
+    Args:
+        img_data: Encoded image bytes (JPEG/PNG/...)
         
-        # Try OpenCV first
+    Returns:
+        RGB image as numpy array
+    """
+    try:
+        # Try OpenCV first (large JPEGs are decoded at reduced scale)
         np_arr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        img = cv2.imdecode(np_arr, _imdecode_flags(img_data))
         
         if img is not None:
-            # Convert BGR to RGB
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            logger.debug(f"OpenCV decode success: {img_rgb.shape}")
+            # Convert BGR to RGB (zero-copy view, made contiguous once in normalize_image_for_deepface)
+            img_rgb = img[:, :, ::-1]
+            logger.debug("OpenCV decode success: %s", img_rgb.shape)
         else:
             # Fallback to PIL
             img_pil = Image.open(io.BytesIO(img_data))
             if img_pil.mode != 'RGB':
                 img_pil = img_pil.convert('RGB')
             img_rgb = np.array(img_pil, dtype=np.uint8)
-            logger.debug(f"PIL decode success: {img_rgb.shape}")
+            logger.debug("PIL decode success: %s", img_rgb.shape)
         
         # Validate image
         if len(img_rgb.shape) != 3 or img_rgb.shape[2] != 3:
@@ -101,46 +188,89 @@ def decode_base64_image(image_base64: str) -> np.ndarray:
             raise ValueError(f"Image too small: {width}x{height}")
         
         # Resize if too large
-        if width > 2048 or height > 2048:
-            max_size = 2048
+        if width > MAX_IMAGE_SIZE or height > MAX_IMAGE_SIZE:
+            max_size = MAX_IMAGE_SIZE
             ratio = max_size / max(width, height)
             new_width = int(width * ratio)
             new_height = int(height * ratio)
-            img_pil = Image.fromarray(img_rgb)
-            img_pil = img_pil.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            img_rgb = np.array(img_pil, dtype=np.uint8)
+            img_rgb = cv2.resize(img_rgb, (new_width, new_height), interpolation=cv2.INTER_AREA)
             logger.info(f"Resized image to {new_width}x{new_height}")
         
         return normalize_image_for_deepface(img_rgb)
         
+    except Exception as e:
+        logger.error(f"Error decoding image bytes: {e}")
+        raise ValueError(f"Failed to decode image: {e}")
+
+def decode_base64_image(image_base64: str) -> np.ndarray:
+    """
+    Decode base64 image to numpy array in RGB format
+    
+    Args:
+        image_base64: Base64 encoded image string
+        
+    Returns:
+        RGB image as numpy array (read-only, shared with the decode cache; use .copy() to modify)
+    """
+    # Encoded once: hashed for the cache key and handed to the decoder as-is
+    payload = image_base64.encode()
+    key = xxhash.xxh3_128_digest(payload)
+    
+    with _decode_cache_lock:
+        cached = _decode_cache.get(key)
+        if cached is not None:
+            _decode_cache.move_to_end(key)
+            logger.debug("Decode cache hit")
+            return cached
+    
+    try:
+        img_data = decode_base64_to_bytes(payload)
+        
     except Exception as e:
         logger.error(f"Error decoding base64 image: {e}")
         raise ValueError(f"Failed to decode image: {e}")
+    
+    img_rgb = decode_image_bytes(img_data)
+    img_rgb.flags.writeable = False
+    
+    with _decode_cache_lock:
+        _decode_cache[key] = img_rgb
+        _decode_cache.move_to_end(key)
+        while len(_decode_cache) > DECODE_CACHE_SIZE:
+            _decode_cache.popitem(last=False)
+    
+    return img_rgb
 
-def encode_image_to_base64(image: np.ndarray, format: str = 'JPEG', quality: int = 95) -> str:
+def encode_image_to_base64(image: np.ndarray, format: str = 'JPEG', quality: int = 85) -> str:
     """
     Encode numpy array image to base64 string
     
     Args:
         image: Image as numpy array (RGB)
-        format: Image format ('JPEG' or 'PNG')
-        quality: JPEG quality (1-100)
+        format: Image format ('JPEG', 'WEBP' or 'PNG')
+        quality: JPEG/WEBP quality (1-100)
         
     Returns:
         Base64 encoded image string with header
     """
     try:
-        # Convert RGB to BGR for OpenCV
+        # Convert RGB to BGR for OpenCV (channel swap fused into a single copy)
         if len(image.shape) == 3 and image.shape[2] == 3:
-            img_bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            img_bgr = np.ascontiguousarray(image[:, :, ::-1])
         else:
             img_bgr = image
         
         # Encode image
         if format.upper() == 'JPEG':
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+            # Baseline JPEG without the extra Huffman optimization pass
+            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality, int(cv2.IMWRITE_JPEG_OPTIMIZE), 0, int(cv2.IMWRITE_JPEG_PROGRESSIVE), 0]
             success, buffer = cv2.imencode('.jpg', img_bgr, encode_param)
             mime_type = 'image/jpeg'
+        elif format.upper() == 'WEBP':
+            # Smaller than JPEG at comparable quality
+            encode_param = [int(cv2.IMWRITE_WEBP_QUALITY), quality]
+            success, buffer = cv2.imencode('.webp', img_bgr, encode_param)
+            mime_type = 'image/webp'
         else:
             success, buffer = cv2.imencode('.png', img_bgr)
             mime_type = 'image/png'
@@ -148,9 +278,9 @@ def encode_image_to_base64(image: np.ndarray, format: str = 'JPEG', quality: int
         if not success:
             raise ValueError(f"Failed to encode image as {format}")
         
-        # Convert to base64
-        base64_image = base64.b64encode(buffer).decode('utf-8')
-        return f"data:{mime_type};base64,{base64_image}"
+        # Convert to base64 (data URI built as bytes, decoded to str once)
+        prefix = f"data:{mime_type};base64,".encode('ascii')
+        return (prefix + pybase64.b64encode(buffer)).decode('ascii')
         
     except Exception as e:
         logger.error(f"Error encoding image to base64: {e}")
@@ -177,10 +307,8 @@ def resize_image(image: np.ndarray, max_size: int = 1024) -> np.ndarray:
         new_width = int(width * ratio)
         new_height = int(height * ratio)
         
-        img_pil = Image.fromarray(image)
-        img_pil = img_pil.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        return np.array(img_pil, dtype=np.uint8)
+        # Always a downscale here: INTER_AREA, no PIL <-> NumPy copies
+        return cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
         
     except Exception as e:
         logger.error(f"Error resizing image: {e}")